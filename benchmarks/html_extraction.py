@@ -0,0 +1,101 @@
+"""
+Measure the HTML text extraction of the web crawler on saved HTML pages.
+
+Usage:
+    python benchmarks/html_extraction.py [--folder <folder with .html files>] [--pages 50] [--repeat 3]
+
+Without --folder, synthetic pages are generated: an article surrounded by navigation menus, a cookie banner, a sidebar
+of related links and a footer. Every page is extracted with each available parser and extraction mode, and the table
+shows the bytes read, the words extracted and the time spent per page.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ollama_chat
+from ollama_chat import SimpleWebCrawler
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor", "incididunt", "labore"]
+
+def sentence(rng, length):
+    return " ".join(rng.choices(WORDS, k=length)).capitalize() + "."
+
+def generate_page(rng):
+    menu = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(30))
+    related = "".join(f'<li><a href="/article/{rng.randint(1, 9999)}">{sentence(rng, 6)}</a></li>' for _ in range(20))
+    paragraphs = "".join(f"<p>{' '.join(sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 6)))}</p>" for _ in range(rng.randint(5, 15)))
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{sentence(rng, 5)}</title>
+<style>body {{ font-family: sans-serif; }}</style><script>var tracking = {{}};</script></head>
+<body>
+<div id="cookie-banner" class="cookie-consent"><p>We use cookies to improve your experience, by continuing you accept our cookie policy.</p><button>Accept</button></div>
+<header class="site-header"><nav class="main-menu"><ul>{menu}</ul></nav></header>
+<div class="layout">
+<div class="article-content"><h1>{sentence(rng, 6)}</h1>{paragraphs}</div>
+<aside class="sidebar"><h3>Related articles</h3><ul>{related}</ul></aside>
+</div>
+<footer class="site-footer"><p>Copyright, all rights reserved, terms of use, privacy policy, contact us, about us.</p><ul>{menu}</ul></footer>
+<script>console.log("loaded");</script>
+</body></html>"""
+
+def load_pages(folder):
+    pages = []
+    for root, dirs, files in os.walk(folder):
+        for file in sorted(files):
+            if file.endswith((".html", ".htm")):
+                with open(os.path.join(root, file), 'rb') as f:
+                    pages.append(f.read())
+    return pages
+
+def run_benchmark(pages, parser, mode, repeat):
+    ollama_chat.html_parser = parser
+    crawler = SimpleWebCrawler([])
+    crawler.extraction_mode = mode
+
+    words = 0
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        words = 0
+        for page in pages:
+            text = crawler.extract_text_from_html(crawler.decode_content(page))
+            words += len(text.split())
+    elapsed_time = (time.perf_counter() - start_time) / repeat
+
+    return {
+        'bytes_in': sum(len(page) for page in pages) // len(pages),
+        'words_out': words // len(pages),
+        'ms_per_page': elapsed_time * 1000 / len(pages),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the HTML text extraction of the web crawler.')
+    parser.add_argument('--folder', type=str, help='Folder containing saved HTML pages', default=None)
+    parser.add_argument('--pages', type=int, help='Number of synthetic pages', default=50)
+    parser.add_argument('--repeat', type=int, help='Number of runs, the average time is reported', default=3)
+    args = parser.parse_args()
+
+    if args.folder:
+        pages = load_pages(args.folder)
+    else:
+        rng = random.Random(42)
+        pages = [generate_page(rng).encode('utf-8') for _ in range(args.pages)]
+
+    if not pages:
+        print("No HTML pages found.")
+        return
+
+    parsers = ['html.parser'] + (['lxml'] if importlib.util.find_spec('lxml') else [])
+
+    print(f"{'parser':>12} {'mode':>5} {'bytes in':>10} {'words out':>10} {'ms/page':>8}")
+    for html_parser in parsers:
+        for mode in ['full', 'main']:
+            result = run_benchmark(pages, html_parser, mode, args.repeat)
+            print(f"{html_parser:>12} {mode:>5} {result['bytes_in']:>10} {result['words_out']:>10} {result['ms_per_page']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
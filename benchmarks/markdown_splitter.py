@@ -0,0 +1,81 @@
+"""
+Measure MarkdownSplitter throughput on a large Markdown corpus.
+
+Usage:
+    python benchmarks/markdown_splitter.py [--folder <folder with .md files>] [--size-mb 8] [--chunk-size 1000]
+
+Without --folder, a synthetic corpus with many headings, blank lines and paragraphs of varying size is generated.
+The corpus is split at 1x, 2x and 4x its size to show that the splitter scales linearly.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ollama_chat import MarkdownSplitter
+
+def generate_corpus(size_mb, seed=42):
+    random.seed(seed)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor"]
+    lines = []
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        level = random.choice([1, 2, 2, 3, 3, 3, 4])
+        heading = "#" * level + " " + " ".join(random.choices(words, k=3))
+        lines.append(heading)
+        lines.append("")
+        for _ in range(random.randint(1, 6)):
+            # Mostly short paragraphs, with the occasional huge one
+            length = random.choice([3, 10, 40, 80, 2000])
+            lines.append(" ".join(random.choices(words, k=length)))
+            lines.extend([""] * random.randint(1, 3))
+        size = sum(len(line) + 1 for line in lines)
+    return "\n".join(lines)
+
+def load_corpus(folder):
+    contents = []
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            if file.endswith(".md"):
+                with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                    contents.append(f.read())
+    return "\n".join(contents)
+
+def run_benchmark(content, split_paragraphs, max_chunk_size):
+    start_time = time.perf_counter()
+    chunks = MarkdownSplitter(content, split_paragraphs=split_paragraphs, max_chunk_size=max_chunk_size).split()
+    elapsed_time = time.perf_counter() - start_time
+
+    sizes = sorted(len(chunk) for chunk in chunks) or [0]
+    return {
+        'elapsed_time': elapsed_time,
+        'throughput': len(content) / (1024 * 1024) / elapsed_time if elapsed_time > 0 else 0,
+        'chunks': len(chunks),
+        'min': sizes[0],
+        'median': sizes[len(sizes) // 2],
+        'max': sizes[-1],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Markdown splitter.')
+    parser.add_argument('--folder', type=str, help='Folder containing Markdown files to use as corpus', default=None)
+    parser.add_argument('--size-mb', type=float, help='Size of the synthetic corpus in MB', default=8)
+    parser.add_argument('--chunk-size', type=int, help='Maximum chunk size in characters', default=1000)
+    args = parser.parse_args()
+
+    content = load_corpus(args.folder) if args.folder else generate_corpus(args.size_mb)
+
+    print(f"{'corpus':>10} {'paragraphs':>10} {'budget':>7} {'seconds':>8} {'MB/s':>8} {'chunks':>8} {'min':>6} {'median':>6} {'max':>6}")
+    for multiplier in [1, 2, 4]:
+        corpus = "\n".join([content] * multiplier)
+        corpus_size = f"{len(corpus) / (1024 * 1024):.1f} MB"
+        for split_paragraphs in [False, True]:
+            for max_chunk_size in [None, args.chunk_size]:
+                result = run_benchmark(corpus, split_paragraphs, max_chunk_size)
+                print(f"{corpus_size:>10} {str(split_paragraphs):>10} {str(max_chunk_size or '-'):>7} {result['elapsed_time']:>8.2f} {result['throughput']:>8.1f} {result['chunks']:>8} {result['min']:>6} {result['median']:>6} {result['max']:>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Measure the time to first token of a long chat with a running Ollama server, depending on where the memories are placed.
+
+Usage:
+    python benchmarks/prefix_cache.py --model <model> [--turns 20] [--num-ctx 8192]
+
+The same synthetic chat is replayed twice. With the "system" layout, the memories relevant to each question are written
+in the system prompt, so the first message changes at every turn and the whole history is evaluated again. With the
+"ephemeral" layout, used by ollama_chat.py, they are sent in a message right before the last question, and the server
+reuses the key-value cache of the unchanged system prompt and earlier turns. The table shows, per turn, the time to
+first token and the number of prompt tokens evaluated by the server.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ollama_chat
+
+WORDS = ["garden", "river", "budget", "holiday", "train", "recipe", "meeting", "report", "bicycle", "concert", "library", "mountain", "project", "weather"]
+SYSTEM_PROMPT = "You are a helpful assistant. Answer in one short sentence."
+
+def sentence(rng, length):
+    return " ".join(rng.choices(WORDS, k=length)).capitalize() + "."
+
+def generate_chat(turns, seed=42):
+    rng = random.Random(seed)
+    chat = []
+    for i in range(turns):
+        question = f"Question {i}: " + " ".join(sentence(rng, 12) for _ in range(6))
+        answer = " ".join(sentence(rng, 12) for _ in range(8))
+        memories = f"<short-term-memories>\nIn the past we talked about...\n{sentence(rng, 20)}\n</short-term-memories>"
+        chat.append((question, answer, memories))
+    return chat
+
+def time_first_token(model, messages, num_ctx):
+    start_time = time.perf_counter()
+    first_token_time = None
+    prompt_eval_count = None
+    stream = ollama_chat.get_ollama_clients().chat(model=model, messages=messages, stream=True, options={"temperature": 0, "num_ctx": num_ctx, "num_predict": 8})
+    for chunk in stream:
+        if first_token_time is None:
+            first_token_time = time.perf_counter() - start_time
+        if chunk.get('done'):
+            prompt_eval_count = chunk.get('prompt_eval_count')
+    return first_token_time, prompt_eval_count
+
+def run_layout(model, chat, layout, num_ctx):
+    conversation = [{"role": "system", "content": SYSTEM_PROMPT}]
+    results = []
+    for question, answer, memories in chat:
+        conversation.append({"role": "user", "content": question})
+        if layout == "system":
+            messages = [dict(message) for message in conversation]
+            messages[0]["content"] = f"{SYSTEM_PROMPT}\n\n{memories}"
+        else:
+            messages = ollama_chat.add_ephemeral_context(conversation, memories)
+        results.append(time_first_token(model, messages, num_ctx))
+        # The recorded answer is used instead of the generated one, so both layouts replay the same chat
+        conversation.append({"role": "assistant", "content": answer})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the time to first token of long chats with a running Ollama server.')
+    parser.add_argument('--model', type=str, help='Ollama model', required=True)
+    parser.add_argument('--turns', type=int, help='Number of turns of the chat', default=20)
+    parser.add_argument('--num-ctx', type=int, help='Context window size, large enough for the whole chat', default=8192)
+    args = parser.parse_args()
+
+    chat = generate_chat(args.turns)
+    # Load the model before measuring
+    time_first_token(args.model, [{"role": "user", "content": "Hello"}], args.num_ctx)
+
+    layouts = {layout: run_layout(args.model, chat, layout, args.num_ctx) for layout in ["system", "ephemeral"]}
+
+    print(f"{'turn':>4} {'system ttft':>12} {'tokens':>7} {'ephemeral ttft':>15} {'tokens':>7}")
+    for turn in range(args.turns):
+        system_ttft, system_tokens = layouts["system"][turn]
+        ephemeral_ttft, ephemeral_tokens = layouts["ephemeral"][turn]
+        print(f"{turn + 1:>4} {system_ttft * 1000:>10.0f}ms {system_tokens or 0:>7} {ephemeral_ttft * 1000:>13.0f}ms {ephemeral_tokens or 0:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Synthetic labelled corpus for the retrieval benchmark.
+
+Every document covers one topic, made of a few rare words shared with a handful of distractor documents, plus an
+error code found only in this document. Queries reuse some of the rare words of a document, or its error code, so each
+query has exactly one relevant document.
+"""
+import json
+import os
+import random
+
+COMMON_WORDS = ["system", "value", "process", "user", "report", "change", "service", "data", "network", "device", "update", "support", "result", "issue", "request", "level", "option", "status", "record", "check"]
+QUESTION_TEMPLATES = [
+    "What does the documentation say about {terms}?",
+    "How do I handle {terms}?",
+    "Explain {terms}",
+    "Is there anything about {terms} in the manual?",
+]
+
+def make_word(rng, length=None):
+    consonants = "bcdfghjklmnprstvz"
+    vowels = "aeiou"
+    length = length or rng.randint(3, 5)
+    return "".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(length))
+
+def generate_corpus(documents=500, queries=200, seed=42):
+    """
+    Generate a labelled corpus.
+
+    :param documents: Number of documents.
+    :param queries: Number of queries.
+    :param seed: Random seed, the same seed always produces the same corpus.
+    :return: A tuple (documents, queries), documents being a dict of file name to content and queries a list of dicts with a "query" and the list of "relevant" file names.
+    """
+    rng = random.Random(seed)
+    vocabulary = sorted({make_word(rng) for _ in range(documents * 2)})
+
+    corpus = {}
+    topics = {}
+    for i in range(documents):
+        file_name = f"doc_{i:05d}.txt"
+        # Neighbouring documents share one rare word, so queries on a single word are ambiguous
+        topic = [vocabulary[i % len(vocabulary)], vocabulary[(i + 1) % len(vocabulary)], rng.choice(vocabulary)]
+        error_code = f"ERR-{rng.randint(1000, 9999)}-{i}"
+        sentences = []
+        for _ in range(rng.randint(4, 10)):
+            words = rng.sample(COMMON_WORDS, 6) + rng.sample(topic, 2)
+            rng.shuffle(words)
+            sentences.append(" ".join(words).capitalize() + ".")
+        sentences.insert(rng.randint(0, len(sentences)), f"Error code {error_code} is reported when the {topic[0]} {rng.choice(COMMON_WORDS)} fails.")
+        corpus[file_name] = " ".join(sentences)
+        topics[file_name] = (topic, error_code)
+
+    labelled_queries = []
+    file_names = sorted(corpus)
+    for _ in range(queries):
+        file_name = rng.choice(file_names)
+        topic, error_code = topics[file_name]
+        if rng.random() < 0.25:
+            terms = error_code
+        else:
+            terms = " ".join(rng.sample(topic, 2))
+        labelled_queries.append({"query": rng.choice(QUESTION_TEMPLATES).format(terms=terms), "relevant": [file_name]})
+
+    return corpus, labelled_queries
+
+def load_fixture(folder, queries_file):
+    """
+    Load a fixture corpus: every text file of a folder, and a JSON list of {"query": ..., "relevant": [file names]}.
+    """
+    corpus = {}
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            with open(os.path.join(root, file), 'r', encoding='utf-8', errors='ignore') as f:
+                corpus[os.path.relpath(os.path.join(root, file), folder)] = f.read()
+
+    with open(queries_file, 'r', encoding='utf-8') as f:
+        labelled_queries = json.load(f)
+
+    return corpus, labelled_queries
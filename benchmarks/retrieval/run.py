@@ -0,0 +1,221 @@
+"""
+Measure retrieval latency and quality of query_vector_database, without Ollama.
+
+Usage:
+    python benchmarks/retrieval/run.py [--documents 500] [--queries 200] [--n-results 5] [--output results.json]
+    python benchmarks/retrieval/run.py --folder <folder with .txt/.md files> --queries-file <queries.json>
+
+A synthetic labelled corpus (or a fixture folder with a JSON list of {"query": ..., "relevant": [file names]}) is indexed
+in a temporary ChromaDB database with a deterministic bag-of-words embedding function replacing the Ollama embed call.
+Every query is then run with hybrid search (vector and keyword search fused) and with BM25 re-ranking of the vector
+search results only. The report is printed as JSON: p50/p95 latency per stage, recall@k and MRR for each mode.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+# Keep the manifest, keyword index and caches of the benchmark away from the user data directory
+os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp(prefix="ollama_chat_benchmark_")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import chromadb
+
+import ollama_chat
+from corpus import generate_corpus, load_fixture
+
+COLLECTION_NAME = "benchmark"
+EMBEDDING_MODEL = "benchmark-embedder"
+EMBEDDING_DIMENSIONS = 256
+word_pattern = re.compile(r'\w+')
+
+def embed_text(text):
+    """
+    Deterministic embedding: hashed bag of words, L2 normalized.
+    """
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for word in word_pattern.findall(text.lower()):
+        digest = hashlib.md5(word.encode('utf-8')).digest()
+        vector[digest[0] % EMBEDDING_DIMENSIONS] += 1.0 if digest[1] % 2 == 0 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+def fake_embed(model=None, input=None, **kwargs):
+    if isinstance(input, str):
+        input = [input]
+    return {"model": model, "embeddings": [embed_text(text) for text in input]}
+
+class StageTimer:
+    """
+    Wrap functions of the ollama_chat module to accumulate the time spent in each stage of a query.
+    """
+    def __init__(self):
+        self.current = {}
+
+    def wrap(self, owner, name, stage):
+        function = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.current[stage] = self.current.get(stage, 0) + time.perf_counter() - start_time
+
+        setattr(owner, name, timed)
+
+    def reset(self):
+        self.current = {}
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def index_corpus(corpus, folder, client, batch_size):
+    for file_name, content in corpus.items():
+        file_path = os.path.join(folder, file_name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    start_time = time.perf_counter()
+    indexer = ollama_chat.DocumentIndexer(folder, COLLECTION_NAME, client, EMBEDDING_MODEL, batch_size=batch_size)
+    indexer.index_documents(no_chunking_confirmation=True)
+    return time.perf_counter() - start_time
+
+def load_chunk_files(client, folder):
+    """
+    Map the text of every indexed chunk to the file it comes from, to recover the ranked files from the formatted answers.
+    """
+    result = client.get_collection(COLLECTION_NAME).get(include=["documents", "metadatas"])
+    chunk_files = {}
+    for document, metadata in zip(result["documents"], result["metadatas"]):
+        chunk_files[document.strip()] = os.path.relpath(metadata["filename"], folder)
+    return chunk_files
+
+def ranked_files(answer, chunk_files):
+    positions = []
+    for document, file_name in chunk_files.items():
+        position = answer.find(document)
+        if position >= 0:
+            positions.append((position, file_name))
+
+    ranking = []
+    for _, file_name in sorted(positions):
+        if file_name not in ranking:
+            ranking.append(file_name)
+    return ranking
+
+def run_queries(labelled_queries, chunk_files, n_results, timer):
+    latencies = {}
+    recall_hits = 0
+    reciprocal_ranks = 0
+
+    for labelled_query in labelled_queries:
+        timer.reset()
+        start_time = time.perf_counter()
+        answer = ollama_chat.query_vector_database(labelled_query["query"], collection_name=COLLECTION_NAME, n_results=n_results, query_embeddings_model=EMBEDDING_MODEL, expand_query=False)
+        total = time.perf_counter() - start_time
+
+        # search_collection includes the query embedding, report the vector search alone
+        stages = dict(timer.current)
+        stages["vector_search"] = stages.get("vector_search", 0) - stages.get("embedding", 0)
+        stages["rerank"] = total - sum(stages.values())
+        stages["total"] = total
+        for stage, elapsed_time in stages.items():
+            latencies.setdefault(stage, []).append(elapsed_time * 1000)
+
+        ranking = ranked_files(answer, chunk_files)
+        relevant = set(labelled_query["relevant"])
+        if relevant.intersection(ranking[:n_results]):
+            recall_hits += 1
+        for rank, file_name in enumerate(ranking[:n_results], start=1):
+            if file_name in relevant:
+                reciprocal_ranks += 1 / rank
+                break
+
+    count = len(labelled_queries) or 1
+    return {
+        "latency_ms": {stage: {"p50": round(percentile(values, 0.5), 3), "p95": round(percentile(values, 0.95), 3)} for stage, values in latencies.items()},
+        f"recall@{n_results}": round(recall_hits / count, 4),
+        "mrr": round(reciprocal_ranks / count, 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark retrieval latency and quality.')
+    parser.add_argument('--folder', type=str, help='Folder containing the fixture corpus (.txt and .md files)', default=None)
+    parser.add_argument('--queries-file', type=str, help='JSON file with the labelled queries of the fixture corpus', default=None)
+    parser.add_argument('--documents', type=int, help='Number of documents of the synthetic corpus', default=500)
+    parser.add_argument('--queries', type=int, help='Number of queries of the synthetic corpus', default=200)
+    parser.add_argument('--seed', type=int, help='Random seed of the synthetic corpus', default=42)
+    parser.add_argument('--n-results', type=int, help='Number of results per query (k of recall@k)', default=5)
+    parser.add_argument('--batch-size', type=int, help='Indexing batch size', default=64)
+    parser.add_argument('--output', type=str, help='Write the JSON report to this file instead of the standard output', default=None)
+    args = parser.parse_args()
+
+    if args.folder and not args.queries_file:
+        parser.error("--folder requires --queries-file")
+
+    if args.folder:
+        corpus, labelled_queries = load_fixture(args.folder, args.queries_file)
+    else:
+        corpus, labelled_queries = generate_corpus(args.documents, args.queries, args.seed)
+
+    ollama_chat.get_ollama_clients().embed = fake_embed
+
+    # Messages of the indexer and of query_vector_database go to stderr, the report to stdout
+    ollama_chat.on_print = lambda message, style="", prompt="": print(message, file=sys.stderr)
+    ollama_chat.verbose_mode = False
+
+    client = chromadb.PersistentClient(path=tempfile.mkdtemp(prefix="ollama_chat_benchmark_chroma_"))
+    ollama_chat.chroma_client = client
+
+    folder = tempfile.mkdtemp(prefix="ollama_chat_benchmark_corpus_")
+    indexing_time = index_corpus(corpus, folder, client, args.batch_size)
+    ollama_chat.set_current_collection(COLLECTION_NAME)
+    chunk_files = load_chunk_files(client, folder)
+
+    timer = StageTimer()
+    timer.wrap(ollama_chat, "get_embedding", "embedding")
+    timer.wrap(ollama_chat, "search_collection", "vector_search")
+    timer.wrap(ollama_chat.KeywordIndex, "search", "keyword_search")
+
+    modes = {}
+    for mode, use_keyword_index in [("hybrid", True), ("vector_bm25", False)]:
+        ollama_chat.use_keyword_index = use_keyword_index
+        modes[mode] = run_queries(labelled_queries, chunk_files, args.n_results, timer)
+
+    report = {
+        "commit": get_git_commit(),
+        "python": platform.python_version(),
+        "corpus": {"documents": len(corpus), "chunks": len(chunk_files), "queries": len(labelled_queries), "synthetic": not args.folder},
+        "indexing_seconds": round(indexing_time, 3),
+        "modes": modes,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import ollama
+import httpx
 import platform
-import tempfile
 from colorama import Fore, Style
 import chromadb
 
@@ -17,19 +17,40 @@ import sys
 import json
 import importlib.util
 import inspect
+import time
+import hashlib
+import sqlite3
+import threading
+import queue
+import atexit
+import multiprocessing
+import io
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from email.utils import parsedate_to_datetime
+from array import array
 from appdirs import AppDirs
 from datetime import date, datetime
 from pygments import highlight
 from pygments.lexers import get_lexer_by_name
 from pygments.formatters import Terminal256Formatter
 from duckduckgo_search import DDGS
+from duckduckgo_search.exceptions import RatelimitException
 from bs4 import BeautifulSoup
 from markdownify import MarkdownConverter
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 from PyPDF2 import PdfReader
 import chardet
+import codecs
 from rank_bm25 import BM25Okapi
 
+# Worker processes are spawned, not forked: forking while the embedding, writer or crawler threads hold locks (httpx, sqlite, chromadb) can deadlock the children
+process_pool_context = multiprocessing.get_context("spawn")
+
 APP_NAME = "ollama-chat"
 APP_AUTHOR = ""
 APP_VERSION = "1.0.0"
@@ -41,6 +62,35 @@ chroma_client = None
 current_collection_name = None
 collection = None
 number_of_documents_to_return_from_vector_db = 5
+index_batch_size = 0
+incremental_indexing = True
+index_jobs = 1
+web_crawl_jobs = 4
+web_crawl_jobs_per_host = 2
+http_session = None
+http_cache = None
+http_cache_file = "http_cache.db"
+http_cache_max_size = 256
+http_timeout = 30
+web_timeout = 20
+web_max_download_size = 10
+web_search_client = None
+ollama_clients = None
+web_search_cache = None
+web_search_cache_file = "web_search_cache.db"
+web_search_cache_ttl = 24
+web_search_retries = 3
+web_extraction_mode = "main"
+pdf_max_pages = 200
+pdf_parallel_pages = 20
+pdf_text_cache = None
+pdf_text_cache_file = "pdf_text_cache.db"
+pdf_process_pool = None
+pdf_process_pool_lock = threading.Lock()
+streaming_file_size = 16 * 1024 * 1024
+index_chunk_size = 1000
+use_keyword_index = True
+keyword_indexes = {}
 temperature = 0.1
 verbose_mode = False
 embeddings_model = None
@@ -52,6 +102,8 @@ selected_tools = []  # Initially no tools selected
 current_model = None
 alternate_model = None
 memory_manager = None
+context_budget = 0
+context_keep_turns = 4
 
 other_instance_url = None
 listening_port = None
@@ -65,10 +117,61 @@ chroma_db_path = None
 
 custom_tools = []
 web_cache_collection_name = "web_cache"
+web_cache_max_age_days = 30
+web_cache_max_chunks = 20000
+web_cache_max_size = 200
+web_cache_compaction_interval = 3600
+web_cache_tracker = None
+web_cache_compaction_thread = None
+web_cache_last_compaction = 0
 memory_collection_name = "memory"
 long_term_memory_file = "long_term_memory.json"
+embedding_cache = None
+embedding_cache_file = "embedding_cache.db"
+embedding_cache_max_entries = 100000
+query_expansion_cache = None
+query_expansion_cache_file = "query_expansion_cache.db"
+query_expansion_cache_ttl = 168
+query_expansion_cache_max_entries = 10000
+llm_response_cache = None
+llm_response_cache_file = "llm_response_cache.db"
+llm_response_cache_ttl = 168
+llm_response_cache_max_entries = 10000
+
+stop_words = frozenset(['i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't"])
+
+# Tokenizer tables, built once: every character which is neither a word character, a whitespace, a dot nor a comma is replaced by a space
+punctuation_pattern = re.compile(r'[^\w\s.,]')
+separator_pattern = re.compile(r'[.,](?= )')
+# Identifiers such as error codes or part numbers (ERR-1234, RFC/2616, 10:30) are kept as a single token, their parts joined by underscores
+identifier_pattern = re.compile(r'\w*\d\w*(?:[-/:]\w+)+|\w+(?:[-/:]\w+)*[-/:]\w*\d\w*')
+identifier_separator_pattern = re.compile(r'[-/:]')
+ascii_punctuation_table = str.maketrans({chr(i): ' ' for i in range(128) if not (chr(i).isalnum() or chr(i) == '_' or chr(i).isspace() or chr(i) in '.,')})
+
+# Output of the threads generating responses concurrently, recorded by the output functions below and replayed once the generations finish
+output_buffer = threading.local()
+
+def is_output_buffered():
+    return getattr(output_buffer, 'calls', None) is not None
+
+def buffer_output(function, *args):
+    """
+    Record a call to an output function instead of running it when the current thread buffers its output.
+
+    :return: True if the call was recorded.
+    """
+    if not is_output_buffered():
+        return False
+    output_buffer.calls.append((function, args))
+    return True
 
-stop_words = ['i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't"]
+def replay_output(calls):
+    for function, args in calls:
+        function(*args)
+
+def generation_stop_requested():
+    stop_event = getattr(output_buffer, 'stop_event', None)
+    return stop_event is not None and stop_event.is_set()
 
 def on_user_input(input_prompt=None):
     for plugin in plugins:
@@ -83,6 +186,9 @@ def on_user_input(input_prompt=None):
         return input()
 
 def on_print(message, style="", prompt=""):
+    if buffer_output(on_print, message, style, prompt):
+        return
+
     function_handled = False
     for plugin in plugins:
         if hasattr(plugin, "on_print") and callable(getattr(plugin, "on_print")):
@@ -96,6 +202,9 @@ def on_print(message, style="", prompt=""):
             print(message)
 
 def on_stdout_write(message, style="", prompt=""):
+    if buffer_output(on_stdout_write, message, style, prompt):
+        return
+
     function_handled = False
     for plugin in plugins:
         if hasattr(plugin, "on_stdout_write") and callable(getattr(plugin, "on_stdout_write")):
@@ -109,6 +218,9 @@ def on_stdout_write(message, style="", prompt=""):
             sys.stdout.write(message)
 
 def on_llm_token_response(token, style="", prompt=""):
+    if buffer_output(on_llm_token_response, token, style, prompt):
+        return
+
     function_handled = False
     for plugin in plugins:
         if hasattr(plugin, "on_llm_token_response") and callable(getattr(plugin, "on_llm_token_response")):
@@ -122,6 +234,9 @@ def on_llm_token_response(token, style="", prompt=""):
             sys.stdout.write(token)
 
 def on_prompt(prompt, style=""):
+    if buffer_output(on_prompt, prompt, style):
+        return
+
     function_handled = False
     for plugin in plugins:
         if hasattr(plugin, "on_prompt") and callable(getattr(plugin, "on_prompt")):
@@ -135,6 +250,9 @@ def on_prompt(prompt, style=""):
             sys.stdout.write(prompt)
 
 def on_stdout_flush():
+    if buffer_output(on_stdout_flush):
+        return
+
     function_handled = False
     for plugin in plugins:
         if hasattr(plugin, "on_stdout_flush") and callable(getattr(plugin, "on_stdout_flush")):
@@ -225,41 +343,106 @@ def get_available_tools():
     return available_tools
 
 class MarkdownSplitter:
-    def __init__(self, markdown_content, split_paragraphs=False):
+    def __init__(self, markdown_content, split_paragraphs=False, max_chunk_size=None, min_chunk_size=None):
+        """
+        :param markdown_content: The Markdown content to split.
+        :param split_paragraphs: Whether to split sections into paragraphs.
+        :param max_chunk_size: Optional maximum chunk size in characters, larger sections are split.
+        :param min_chunk_size: Sections smaller than this size are merged with the following ones, defaults to a quarter of max_chunk_size.
+        """
         self.markdown_content = markdown_content.splitlines()
         self.sections = []
         self.split_paragraphs = split_paragraphs  # New parameter to control paragraph splitting
+        self.max_chunk_size = max_chunk_size
+        if min_chunk_size is None:
+            min_chunk_size = max_chunk_size // 4 if max_chunk_size else 0
+        self.min_chunk_size = min_chunk_size
+        self.heading_pattern = re.compile(r'^(#{1,4})\s')
     
     def is_heading(self, line):
         """Returns the heading level if the line is a heading, otherwise returns None."""
-        match = re.match(r'^(#{1,4})\s', line)
+        match = self.heading_pattern.match(line)
         return len(match.group(1)) if match else None
 
     def split(self):
+        self.sections = list(self.iter_split())
+        return self.sections
+
+    def iter_split(self, lines=None):
+        """
+        Yield the chunks one by one in a single pass, reading lines lazily.
+        Each chunk is prefixed with its heading hierarchy. When a maximum chunk size is set, small sections are merged
+        and oversized ones are split.
+
+        :param lines: Optional iterable of lines, e.g. an open file, used instead of the content given to the constructor.
+        """
+        if lines is None:
+            lines = self.markdown_content
+
+        if not self.max_chunk_size:
+            for hierarchy, paragraph in self._iter_sections(lines):
+                yield "\n".join(hierarchy + [paragraph])
+            return
+
+        pending_sections = []
+        pending_size = 0
+        for hierarchy, paragraph in self._iter_sections(lines):
+            breadcrumb_size = sum(len(heading) + 1 for heading in hierarchy)
+            section_size = breadcrumb_size + len(paragraph)
+
+            if section_size > self.max_chunk_size:
+                if pending_sections:
+                    yield self._join_sections(pending_sections)
+                    pending_sections, pending_size = [], 0
+
+                # Keep at least half of the budget for the content if the breadcrumb is very long
+                pieces = list(self._split_text(paragraph, max(self.max_chunk_size - breadcrumb_size, self.max_chunk_size // 2)))
+                for piece in pieces[:-1]:
+                    yield "\n".join(hierarchy + [piece])
+
+                # The last piece may be merged with the following sections
+                paragraph = pieces[-1]
+                section_size = breadcrumb_size + len(paragraph)
+
+            if pending_sections and pending_size + section_size > self.max_chunk_size:
+                yield self._join_sections(pending_sections)
+                pending_sections, pending_size = [], 0
+
+            pending_sections.append((hierarchy, paragraph))
+            pending_size += section_size
+
+            if pending_size >= self.min_chunk_size:
+                yield self._join_sections(pending_sections)
+                pending_sections, pending_size = [], 0
+
+        if pending_sections:
+            yield self._join_sections(pending_sections)
+
+    def _iter_sections(self, lines):
+        """
+        Yield (heading hierarchy, paragraph) tuples, a paragraph being a section or a paragraph if split_paragraphs is True.
+        """
         current_hierarchy = []  # Stores the current heading hierarchy
         current_paragraph = []
+        current_paragraph_size = 0
+        empty_line_found = False
 
-        i = 0
-        while i < len(self.markdown_content):
-            line = self.markdown_content[i].strip()  # Remove leading/trailing whitespace
+        for line in lines:
+            line = line.strip()  # Remove leading/trailing whitespace
             
             if not line:  # Empty line found
-                if self.split_paragraphs:  # Only handle splitting when split_paragraphs is True
-                    # Check the next non-empty line
-                    next_non_empty_line = None
-                    for j in range(i + 1, len(self.markdown_content)):
-                        if self.markdown_content[j].strip():  # Find the next non-empty line
-                            next_non_empty_line = self.markdown_content[j].strip()
-                            break
-                    
-                    # If the next non-empty line is a heading or not starting with '#', split paragraph
-                    if next_non_empty_line and (self.is_heading(next_non_empty_line) or not next_non_empty_line.startswith('#')) and len(current_paragraph) > 0:
-                        # Add the paragraph with the current hierarchy
-                        self.sections.append("\n".join(current_hierarchy + ["\n".join(current_paragraph)]))
-                        current_paragraph = []  # Reset for the next paragraph
-
-                i += 1
+                empty_line_found = True
                 continue
+
+            # Only handle splitting when split_paragraphs is True
+            # If the first non-empty line after an empty line is a heading or not starting with '#', split paragraph
+            if self.split_paragraphs and empty_line_found and len(current_paragraph) > 0 and (self.is_heading(line) or not line.startswith('#')):
+                # Add the paragraph with the current hierarchy
+                yield current_hierarchy, "\n".join(current_paragraph)
+                current_paragraph = []  # Reset for the next paragraph
+                current_paragraph_size = 0
+
+            empty_line_found = False
             
             heading_level = self.is_heading(line)
             
@@ -267,8 +450,9 @@ class MarkdownSplitter:
                 # If we encounter a heading, finalize the current paragraph
                 if current_paragraph:
                     # Add the paragraph with the current hierarchy
-                    self.sections.append("\n".join(current_hierarchy + ["\n".join(current_paragraph)]))
+                    yield current_hierarchy, "\n".join(current_paragraph)
                     current_paragraph = []
+                    current_paragraph_size = 0
 
                 # Adjust the hierarchy based on the heading level
                 # Keep only the parts of the hierarchy up to the current heading level
@@ -276,17 +460,330 @@ class MarkdownSplitter:
             else:
                 # Regular content: append the line to the current paragraph
                 current_paragraph.append(line)
+                current_paragraph_size += len(line) + 1
 
-            i += 1
+                # Bound memory usage on huge sections, they are split to the maximum chunk size anyway
+                if self.max_chunk_size and current_paragraph_size >= self.max_chunk_size * 8:
+                    yield current_hierarchy, "\n".join(current_paragraph)
+                    current_paragraph = []
+                    current_paragraph_size = 0
 
         # Finalize the last paragraph if present
         if current_paragraph:
-            self.sections.append("\n".join(current_hierarchy + ["\n".join(current_paragraph)]))
+            yield current_hierarchy, "\n".join(current_paragraph)
+
+    def _join_sections(self, sections):
+        """Join consecutive sections, only adding the headings that differ from the previous section."""
+        parts = []
+        previous_hierarchy = []
+        for hierarchy, paragraph in sections:
+            common_levels = 0
+            while common_levels < min(len(hierarchy), len(previous_hierarchy)) and hierarchy[common_levels] == previous_hierarchy[common_levels]:
+                common_levels += 1
+            parts.extend(hierarchy[common_levels:])
+            parts.append(paragraph)
+            previous_hierarchy = hierarchy
+        return "\n".join(parts)
+
+    def _split_text(self, text, size):
+        """Split text into pieces of at most size characters, on line boundaries, then on word boundaries."""
+        piece_lines = []
+        piece_size = 0
+        for line in text.split("\n"):
+            while len(line) > size:
+                if piece_lines:
+                    yield "\n".join(piece_lines)
+                    piece_lines, piece_size = [], 0
+
+                cut = line.rfind(" ", 0, size + 1)
+                if cut <= 0:
+                    cut = size
+                yield line[:cut]
+                line = line[cut:].lstrip(" ")
+
+            if piece_lines and piece_size + 1 + len(line) > size:
+                yield "\n".join(piece_lines)
+                piece_lines, piece_size = [], 0
+
+            piece_size += len(line) + (1 if piece_lines else 0)
+            piece_lines.append(line)
+
+        if piece_lines:
+            yield "\n".join(piece_lines)
+
+def extract_pdf_pages(pdf_content, start, end):
+    """
+    Extract the text of a range of pages of a PDF held in memory. Runs in a worker process for large documents.
+    """
+    reader = PdfReader(io.BytesIO(pdf_content))
+    return [reader.pages[i].extract_text() or '' for i in range(start, end)]
 
-        return self.sections
+def get_pdf_process_pool():
+    """
+    Return the process pool extracting the pages of large PDF documents, created once and shared by the crawler threads.
+    """
+    global pdf_process_pool
+
+    with pdf_process_pool_lock:
+        if pdf_process_pool is None:
+            pdf_process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=process_pool_context)
+            atexit.register(pdf_process_pool.shutdown, wait=False, cancel_futures=True)
+    return pdf_process_pool
+
+class PdfTextCache:
+    def __init__(self, cache_file="pdf_text_cache.db", max_entries=1000):
+        """
+        Initialize a persistent cache of the text extracted from PDF documents, keyed by document hash, stored in a SQLite database.
+
+        :param cache_file: The name of the SQLite file, created in the user data directory.
+        :param max_entries: Maximum number of documents to keep, least recently used entries are evicted first.
+        """
+        dirs = AppDirs(APP_NAME, APP_AUTHOR, version=APP_VERSION)
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+
+        self.cache_file = os.path.join(dirs.user_data_dir, cache_file)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pdf_texts (document_hash TEXT NOT NULL, max_pages INTEGER NOT NULL, text TEXT NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (document_hash, max_pages))")
+        self.connection.commit()
+
+    def get(self, document_hash, max_pages):
+        with self.lock:
+            row = self.connection.execute("SELECT text FROM pdf_texts WHERE document_hash = ? AND max_pages = ?", (document_hash, max_pages)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE pdf_texts SET last_access = ? WHERE document_hash = ? AND max_pages = ?", (time.time(), document_hash, max_pages))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, document_hash, max_pages, text):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO pdf_texts (document_hash, max_pages, text, last_access) VALUES (?, ?, ?, ?)", (document_hash, max_pages, text, time.time()))
+            self.connection.execute("DELETE FROM pdf_texts WHERE rowid IN (SELECT rowid FROM pdf_texts ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            self.connection.commit()
+
+class HttpCache:
+    def __init__(self, cache_file="http_cache.db", max_size=256 * 1024 * 1024):
+        """
+        Initialize a persistent HTTP cache stored in a SQLite database, honouring Cache-Control, Expires, ETag and Last-Modified.
+
+        :param cache_file: The name of the SQLite file, created in the user data directory.
+        :param max_size: Maximum total size of the cached responses in bytes, oldest responses are evicted first.
+        """
+        dirs = AppDirs(APP_NAME, APP_AUTHOR, version=APP_VERSION)
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+
+        self.cache_file = os.path.join(dirs.user_data_dir, cache_file)
+        self.max_size = max_size
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, status INTEGER NOT NULL, headers TEXT NOT NULL, content BLOB NOT NULL, expires REAL NOT NULL, stored REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_stored ON responses (stored)")
+        self.connection.commit()
+
+    def get(self, url):
+        """
+        Look up a cached response.
+
+        :return: A tuple (status, headers, content, fresh), or None if the URL is not cached.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT status, headers, content, expires FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+
+        status, headers, content, expires = row
+        return status, json.loads(headers), content, expires > time.time()
+
+    def put(self, url, status, headers, content):
+        """
+        Store a response if its headers allow it, or remove the cached response if they do not.
+        """
+        expires = self.get_expiration_time(headers)
+        with self.lock:
+            if expires is None:
+                self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+            else:
+                self.connection.execute("INSERT OR REPLACE INTO responses (url, status, headers, content, expires, stored) VALUES (?, ?, ?, ?, ?, ?)", (url, status, json.dumps(headers), content, expires, time.time()))
+
+                total_size = self.connection.execute("SELECT COALESCE(SUM(LENGTH(content)), 0) FROM responses").fetchone()[0]
+                if total_size > self.max_size:
+                    for evicted_url, size in self.connection.execute("SELECT url, LENGTH(content) FROM responses ORDER BY stored").fetchall():
+                        if total_size <= self.max_size:
+                            break
+                        self.connection.execute("DELETE FROM responses WHERE url = ?", (evicted_url,))
+                        total_size -= size
+            self.connection.commit()
+
+    def refresh(self, url, headers):
+        """
+        Update the expiration time of a cached response after a successful revalidation (304 Not Modified).
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT headers FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return
+            cached_headers = json.loads(row[0])
+            cached_headers.update(headers)
+            expires = self.get_expiration_time(cached_headers)
+            if expires is None:
+                self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+            else:
+                self.connection.execute("UPDATE responses SET headers = ?, expires = ?, stored = ? WHERE url = ?", (json.dumps(cached_headers), expires, time.time(), url))
+            self.connection.commit()
+
+    @staticmethod
+    def get_expiration_time(headers):
+        """
+        Compute until when a response is fresh from its headers.
+
+        :return: The expiration timestamp, the current time for responses that must be revalidated, or None for responses that must not be stored.
+        """
+        headers = CaseInsensitiveDict(headers)
+        directives = {}
+        for directive in headers.get('Cache-Control', '').lower().split(','):
+            name, _, value = directive.strip().partition('=')
+            if name:
+                directives[name] = value.strip('"')
+
+        if 'no-store' in directives or headers.get('Vary', '').strip() == '*':
+            return None
+
+        now = time.time()
+        lifetime = 0
+        if 'no-cache' not in directives:
+            if 'max-age' in directives:
+                try:
+                    lifetime = int(directives['max-age'])
+                except ValueError:
+                    lifetime = 0
+            elif 'Expires' in headers:
+                try:
+                    expires = parsedate_to_datetime(headers['Expires']).timestamp()
+                    date = parsedate_to_datetime(headers['Date']).timestamp() if 'Date' in headers else now
+                    lifetime = expires - date
+                except (TypeError, ValueError):
+                    lifetime = 0
+
+        if lifetime <= 0 and 'ETag' not in headers and 'Last-Modified' not in headers:
+            # Neither fresh nor revalidatable, storing it would be useless
+            return None
+
+        return now + max(lifetime, 0)
+
+    def get_stats(self):
+        requests_count = self.hits + self.revalidations + self.misses
+        hit_rate = ((self.hits + self.revalidations) / requests_count * 100) if requests_count > 0 else 0
+        return f"HTTP cache: {self.hits} fresh hits, {self.revalidations} revalidated, {self.misses} misses ({hit_rate:.1f}% hit rate)."
+
+class CachedSession(requests.Session):
+    """
+    A requests session answering GET requests from an HttpCache when the cached response is fresh, and revalidating it with a conditional request otherwise.
+    """
+    # Headers describing the encoding of the raw body, not valid for the decoded content stored in the cache
+    uncached_headers = {'content-encoding', 'transfer-encoding', 'content-length', 'connection', 'keep-alive', 'set-cookie'}
+
+    def __init__(self, cache=None, timeout=None, pool_size=10):
+        super().__init__()
+        self.cache = cache
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def build_cached_response(self, url, status, headers, content):
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response.url = url
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        # Let iter_content() serve the cached content when the response is streamed
+        response._content_consumed = True
+        return response
+
+    def request(self, method, url, *args, **kwargs):
+        if self.timeout and kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+
+        if not self.cache or method.upper() != 'GET' or kwargs.get('params') or kwargs.get('headers'):
+            return super().request(method, url, *args, **kwargs)
+
+        cached = self.cache.get(url)
+        if cached:
+            status, headers, content, fresh = cached
+            if fresh:
+                self.cache.hits += 1
+                return self.build_cached_response(url, status, headers, content)
+
+            cached_headers = CaseInsensitiveDict(headers)
+            conditional_headers = {}
+            if 'ETag' in cached_headers:
+                conditional_headers['If-None-Match'] = cached_headers['ETag']
+            if 'Last-Modified' in cached_headers:
+                conditional_headers['If-Modified-Since'] = cached_headers['Last-Modified']
+            kwargs['headers'] = conditional_headers
+
+        response = super().request(method, url, *args, **kwargs)
+        response.from_cache = False
+        response.cache_url = url
+        response_headers = {key: value for key, value in response.headers.items() if key.lower() not in self.uncached_headers}
+
+        if cached and response.status_code == 304:
+            self.cache.revalidations += 1
+            self.cache.refresh(url, response_headers)
+            status, headers, content, _ = cached
+            headers.update(response_headers)
+            return self.build_cached_response(url, status, headers, content)
+
+        self.cache.misses += 1
+        if not kwargs.get('stream'):
+            self.store(response, response.content)
+
+        return response
+
+    def store(self, response, content):
+        """
+        Store the content of a response in the cache. Streamed responses are not stored by request(), call this method once their content has been read completely.
+        """
+        if self.cache and response.status_code == 200 and not getattr(response, 'from_cache', False) and response.request is not None and response.request.method == 'GET':
+            self.cache.put(getattr(response, 'cache_url', response.url), response.status_code, {key: value for key, value in response.headers.items() if key.lower() not in self.uncached_headers}, content)
+
+def get_http_session():
+    """
+    Return the HTTP session shared by the web crawler and the plugins, pooling connections and caching responses.
+    """
+    global http_session
+
+    if http_session is None:
+        http_session = CachedSession(cache=http_cache, timeout=http_timeout, pool_size=max(10, web_crawl_jobs))
+    return http_session
+
+# lxml is much faster than the pure-Python parser, use it when installed
+html_parser = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+content_type_charset_pattern = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+meta_charset_pattern = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+boilerplate_pattern = re.compile(r'banner|breadcrumb|combx|comment|community|cookie|consent|disqus|footer|header|menu|modal|nav|popup|promo|related|remark|rss|share|shoutbox|sidebar|skyscraper|social|sponsor|subscribe|newsletter|advert|ad-break|agegate|pagination|pager', re.IGNORECASE)
+# Types which never hold extractable text, skipped without reading the body, other generic or unknown types are sniffed
+binary_mime_type_prefixes = ('image/', 'audio/', 'video/', 'font/', 'model/')
+binary_mime_types = frozenset(['application/zip', 'application/gzip', 'application/x-gzip', 'application/x-tar', 'application/x-bzip2', 'application/x-xz', 'application/x-7z-compressed', 'application/x-rar-compressed', 'application/vnd.rar', 'application/java-archive', 'application/wasm', 'application/x-msdownload', 'application/x-executable', 'application/x-sharedlib', 'application/vnd.android.package-archive', 'application/x-apple-diskimage', 'application/x-iso9660-image', 'application/x-shockwave-flash', 'application/msword', 'application/vnd.ms-excel', 'application/vnd.ms-powerpoint', 'application/ogg'])
+content_hint_pattern = re.compile(r'article|body|content|entry|hentry|h-entry|main|page|post|text|blog|story', re.IGNORECASE)
 
 class SimpleWebCrawler:
-    def __init__(self, urls, llm_enabled=False, system_prompt='', selected_model='', temperature=0.1, verbose=False, plugins=[], num_ctx=None):
+    def __init__(self, urls, llm_enabled=False, system_prompt='', selected_model='', temperature=0.1, verbose=False, plugins=[], num_ctx=None, max_workers=1, max_workers_per_host=2, deadline=None):
+        """
+        :param urls: The URLs to crawl, articles are returned in the same order.
+        :param max_workers: Maximum number of pages fetched and extracted concurrently, 1 to crawl URLs one after another.
+        :param max_workers_per_host: Maximum number of pages fetched concurrently from the same host.
+        :param deadline: Optional time.monotonic() value after which the crawl stops, pages not extracted by then are skipped.
+        """
         self.urls = urls
         self.articles = []
         self.llm_enabled = llm_enabled
@@ -296,27 +793,142 @@ class SimpleWebCrawler:
         self.verbose = verbose
         self.plugins = plugins
         self.num_ctx = num_ctx
+        self.max_workers = max_workers
+        self.max_workers_per_host = max(1, max_workers_per_host)
+        self.host_semaphores = {}
+        self.host_semaphores_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.extraction_mode = web_extraction_mode
+        self.deadline = deadline
+        self.skipped_urls = []
+
+    def get_remaining_time(self):
+        """
+        Return the number of seconds left before the deadline, None if there is no deadline.
+        """
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.monotonic())
 
-    def fetch_page(self, url):
+    def sniff_content_kind(self, content_type, first_bytes):
+        """
+        Choose how to handle a response from its Content-Type header, or from its first bytes when the header is missing or generic.
+
+        :return: "html", "pdf", "text" for other textual content (plain text, Markdown, JSON...), or None for content that cannot be extracted (images, videos, archives...).
+        """
+        mime_type = (content_type or '').split(';')[0].strip().lower()
+        if mime_type == 'application/pdf':
+            return 'pdf'
+        if mime_type in ('text/html', 'application/xhtml+xml', 'text/xml', 'application/xml') or mime_type.endswith('+xml'):
+            return 'html'
+        if mime_type.startswith('text/') or mime_type in ('application/json', 'application/x-ndjson') or mime_type.endswith('+json'):
+            return 'text'
+        if mime_type.startswith(binary_mime_type_prefixes) or mime_type in binary_mime_types or mime_type.startswith('application/vnd.openxmlformats-officedocument.'):
+            return None
+
+        if first_bytes.lstrip().startswith(b'%PDF'):
+            return 'pdf'
+        head = first_bytes[:1024].lower()
+        if b'<html' in head or b'<!doctype html' in head or b'<body' in head:
+            return 'html'
+        if head.strip() and b'\x00' not in head:
+            return 'text'
+        return None
+
+    def fetch_document(self, url):
+        """
+        Download a URL in a streaming way, checking its type and size before reading the body.
+        HTML pages larger than web_max_download_size are truncated, other documents larger than that are skipped.
+
+        :return: A tuple (content, kind, content_type), kind being "html", "pdf" or "text", or None if the URL could not or should not be downloaded.
+        """
+        timeout = None
+        remaining_time = self.get_remaining_time()
+        if remaining_time is not None:
+            if remaining_time <= 0:
+                return None
+            timeout = min(http_timeout, remaining_time) if http_timeout else remaining_time
+
+        max_size = web_max_download_size * 1024 * 1024 if web_max_download_size > 0 else None
+        session = get_http_session()
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            return response.content  # Return raw bytes instead of text for PDF support
+            with session.get(url, timeout=timeout, stream=True) as response:
+                response.raise_for_status()  # Raise an exception for HTTP errors
+                content_type = response.headers.get('Content-Type')
+
+                content_length = None
+                try:
+                    content_length = int(response.headers.get('Content-Length'))
+                except (TypeError, ValueError):
+                    pass
+
+                chunks = response.iter_content(chunk_size=64 * 1024)
+                first_chunk = next(chunks, b'')
+                kind = self.sniff_content_kind(content_type, first_chunk)
+                if kind is None:
+                    if self.verbose:
+                        on_print(f"Skipping URL {url}, unsupported content type: {content_type}", Fore.WHITE + Style.DIM)
+                    return None
+
+                if max_size and kind == 'pdf' and content_length and content_length > max_size:
+                    if self.verbose:
+                        on_print(f"Skipping URL {url}, {content_length} bytes is over the download limit.", Fore.WHITE + Style.DIM)
+                    return None
+
+                content = bytearray(first_chunk)
+                truncated = False
+                if max_size and len(content) > max_size:
+                    if kind == 'pdf':
+                        return None
+                    del content[max_size:]
+                    truncated = True
+                    chunks = iter(())
+                for chunk in chunks:
+                    if max_size and len(content) + len(chunk) > max_size:
+                        if kind == 'pdf':
+                            if self.verbose:
+                                on_print(f"Skipping URL {url}, download limit reached.", Fore.WHITE + Style.DIM)
+                            return None
+                        content.extend(chunk[:max_size - len(content)])
+                        truncated = True
+                        break
+                    content.extend(chunk)
+
+                    if self.stop_event.is_set() or self.get_remaining_time() == 0:
+                        return None
+
+                content = bytes(content)
+                if truncated:
+                    if self.verbose:
+                        on_print(f"Page {url} truncated to {len(content)} bytes.", Fore.WHITE + Style.DIM)
+                elif isinstance(session, CachedSession):
+                    session.store(response, content)
+
+                return content, kind, content_type
         except requests.exceptions.RequestException as e:
             if self.verbose:
                 on_print(f"Error fetching URL {url}: {e}", Fore.RED)
             return None
 
+    def fetch_page(self, url):
+        document = self.fetch_document(url)
+        if document is None:
+            return None
+        return document[0]  # Return raw bytes instead of text for PDF support
+
     def md(self, soup, **options):
         return MarkdownConverter(**options).convert_soup(soup)
 
     def extract_text_from_html(self, html_content):
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = BeautifulSoup(html_content, html_parser)
 
-        # Remove all <script> tags
-        for script in soup.find_all('script'):
+        # Remove all <script> tags, and the other elements which never hold readable text
+        for script in soup.find_all(['script', 'style', 'noscript', 'template', 'svg', 'iframe']):
             script.decompose()
 
+        if self.extraction_mode == "main":
+            soup = self.extract_main_content(soup)
+
         # Convert the modified HTML content to Markdown
         text = self.md(soup, strip=['a', 'img'], heading_style='ATX', 
                        escape_asterisks=False, escape_underscores=False, 
@@ -327,20 +939,120 @@ class SimpleWebCrawler:
 
         return text
 
+    def get_link_density(self, element, text_length):
+        link_length = sum(len(link.get_text(strip=True)) for link in element.find_all('a'))
+        return link_length / text_length if text_length > 0 else 0
+
+    def get_class_weight(self, element):
+        weight = 0
+        for attribute in (" ".join(element.get('class') or []), element.get('id') or ''):
+            if not attribute:
+                continue
+            if boilerplate_pattern.search(attribute):
+                weight -= 25
+            if content_hint_pattern.search(attribute):
+                weight += 25
+        return weight
+
+    def extract_main_content(self, soup):
+        """
+        Keep the main content of a page, readability-style: remove navigation and boilerplate elements, score the containers
+        of the paragraphs by text length, commas, class names and link density, and keep the best container with its
+        well-scored siblings. Returns the whole page when no container stands out.
+        """
+        body = soup.body or soup
+
+        for element in body.find_all(['nav', 'footer', 'aside', 'form', 'button', 'dialog']):
+            element.decompose()
+        for element in body.find_all(True):
+            if element.decomposed or element.name in ('body', 'article', 'main'):
+                continue
+            attributes = " ".join(element.get('class') or []) + " " + (element.get('id') or '') + " " + (element.get('role') or '')
+            if boilerplate_pattern.search(attributes) and not content_hint_pattern.search(attributes):
+                element.decompose()
+
+        scores = {}
+        candidates = {}
+        for paragraph in body.find_all(['p', 'pre', 'td', 'blockquote', 'li']):
+            text = paragraph.get_text(" ", strip=True)
+            if len(text) < 25:
+                continue
+
+            score = 1 + text.count(',') + min(len(text) // 100, 3)
+            for level, ancestor in enumerate((paragraph.parent, paragraph.parent.parent if paragraph.parent else None)):
+                if ancestor is None or ancestor.name in ('[document]', 'html'):
+                    break
+                if id(ancestor) not in candidates:
+                    candidates[id(ancestor)] = ancestor
+                    scores[id(ancestor)] = self.get_class_weight(ancestor) + (5 if ancestor.name in ('article', 'main') else 0)
+                scores[id(ancestor)] += score if level == 0 else score / 2
+
+        if not candidates:
+            return body
+
+        # Penalize containers made of links, such as lists of related articles
+        for key, candidate in candidates.items():
+            scores[key] *= 1 - self.get_link_density(candidate, len(candidate.get_text(strip=True)))
+
+        best_key = max(scores, key=scores.get)
+        best = candidates[best_key]
+        if len(best.get_text(strip=True)) < 250:
+            return body
+
+        # Keep the siblings that look like part of the same content
+        threshold = max(10, scores[best_key] * 0.2)
+        parent = best.parent
+        if parent is None:
+            return best
+
+        content = BeautifulSoup("<div></div>", html_parser).div
+        for sibling in list(parent.children):
+            if sibling is best or (id(sibling) in scores and scores[id(sibling)] >= threshold):
+                content.append(sibling.extract())
+        return content
+
     def extract_text_from_pdf(self, pdf_content):
-        with open('temp.pdf', 'wb') as f:
-            f.write(pdf_content)
+        """
+        Extract the text of the first pdf_max_pages pages of a PDF held in memory, spreading the pages across processes for large documents.
 
-        reader = PdfReader('temp.pdf')
-        text = ''
-        for page in reader.pages:
-            text += page.extract_text()
+        :return: The text, or None if the document could not be parsed.
+        """
+        document_hash = hashlib.sha256(pdf_content).hexdigest()
+        if pdf_text_cache:
+            text = pdf_text_cache.get(document_hash, pdf_max_pages)
+            if text is not None:
+                if self.verbose:
+                    on_print("PDF text found in cache.", Fore.WHITE + Style.DIM)
+                return text
 
-        # Clean up by removing the temporary file
-        os.remove('temp.pdf')
+        try:
+            reader = PdfReader(io.BytesIO(pdf_content))
+            page_count = len(reader.pages)
+            if pdf_max_pages > 0 and page_count > pdf_max_pages:
+                if self.verbose:
+                    on_print(f"PDF has {page_count} pages, only extracting the first {pdf_max_pages}.", Fore.WHITE + Style.DIM)
+                page_count = pdf_max_pages
+
+            jobs = min(os.cpu_count() or 1, page_count // pdf_parallel_pages) if pdf_parallel_pages > 0 else 1
+            if jobs > 1:
+                # Each process parses the document and extracts a contiguous range of pages
+                bounds = [page_count * i // jobs for i in range(jobs + 1)]
+                page_ranges = get_pdf_process_pool().map(extract_pdf_pages, [pdf_content] * jobs, bounds[:-1], bounds[1:])
+                pages = [page for page_range in page_ranges for page in page_range]
+            else:
+                pages = [reader.pages[i].extract_text() or '' for i in range(page_count)]
+        except Exception as e:
+            # A corrupt document only skips this result, not the whole web search
+            on_print(f"Error extracting text from PDF: {e}", Fore.RED)
+            return None
 
         # Return the extracted text, with extra newlines removed
-        return re.sub(r'\n+', '\n', text)
+        text = re.sub(r'\n+', '\n', "\n".join(pages))
+
+        if pdf_text_cache:
+            pdf_text_cache.put(document_hash, pdf_max_pages, text)
+
+        return text
 
     def ask_llm(self, content, user_input):
         # Use the provided ask_ollama function to interact with the LLM
@@ -355,9 +1067,36 @@ class SimpleWebCrawler:
                           stream_active=self.verbose,
                           num_ctx=self.num_ctx)
 
-    def decode_content(self, content):
+    def detect_encoding(self, content, content_type=None):
+        """
+        Detect the encoding of a page: charset of the Content-Type header, byte order mark, <meta> charset, then chardet on the beginning of the page.
+        """
+        candidates = []
+        if content_type:
+            match = content_type_charset_pattern.search(content_type)
+            if match:
+                candidates.append(match.group(1))
+
+        if content.startswith(codecs.BOM_UTF8):
+            candidates.append('utf-8-sig')
+        elif content.startswith(codecs.BOM_UTF16_LE) or content.startswith(codecs.BOM_UTF16_BE):
+            candidates.append('utf-16')
+
+        match = meta_charset_pattern.search(content[:4096])
+        if match:
+            candidates.append(match.group(1).decode('ascii', errors='ignore'))
+
+        for candidate in candidates:
+            try:
+                return codecs.lookup(candidate).name
+            except LookupError:
+                continue
+
+        return chardet.detect(content[:65536])['encoding']
+
+    def decode_content(self, content, content_type=None):
         # Detect encoding
-        detected_encoding = chardet.detect(content)['encoding']
+        detected_encoding = self.detect_encoding(content, content_type)
         if self.verbose:
             on_print(f"Detected encoding: {detected_encoding}", Fore.WHITE + Style.DIM)
         
@@ -369,43 +1108,125 @@ class SimpleWebCrawler:
                 on_print(f"Error decoding content with {detected_encoding}, using ISO-8859-1 as fallback.", Fore.RED)
             return content.decode('ISO-8859-1')
 
+    def stop_requested(self):
+        for plugin in self.plugins:
+            if hasattr(plugin, "stop_generation") and callable(getattr(plugin, "stop_generation")):
+                plugin_response = getattr(plugin, "stop_generation")()
+                if plugin_response:
+                    return True
+        return False
+
+    def get_host_semaphore(self, url):
+        host = urlparse(url).netloc.lower()
+        with self.host_semaphores_lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.Semaphore(self.max_workers_per_host)
+            return self.host_semaphores[host]
+
+    def fetch_and_extract(self, url):
+        """
+        Fetch a URL and extract its text, or return None if the page could not be fetched or the crawl was stopped.
+        """
+        with self.get_host_semaphore(url):
+            if self.stop_event.is_set():
+                return None
+
+            if self.verbose:
+                on_print(f"Fetching URL: {url}", Fore.WHITE + Style.DIM)
+            document = self.fetch_document(url)
+
+        if document is None or not document[0] or self.stop_event.is_set() or self.get_remaining_time() == 0:
+            return None
+        content, kind, content_type = document
+
+        # The document type is sniffed from the response, not guessed from the URL
+        if kind == 'pdf':
+            if self.verbose:
+                on_print(f"Extracting text from PDF: {url}", Fore.WHITE + Style.DIM)
+            return self.extract_text_from_pdf(content)
+
+        if kind == 'text':
+            # Plain text, Markdown or JSON is kept as is, converting it as HTML would merge its lines
+            return self.decode_content(content, content_type)
+
+        if self.verbose:
+            on_print(f"Extracting text from HTML: {url}", Fore.WHITE + Style.DIM)
+        decoded_content = self.decode_content(content, content_type)
+        return self.extract_text_from_html(decoded_content)
+
+    def add_article(self, url, extracted_text, task=None):
+        article = {'url': url, 'text': extracted_text}
+
+        if self.llm_enabled and task:
+            if self.verbose:
+                on_print(Fore.WHITE + Style.DIM + f"Using LLM to process the content. Task: {task}")
+            llm_result = self.ask_llm(content=extracted_text, user_input=task)
+            article['llm_result'] = llm_result
+
+        self.articles.append(article)
+
     def crawl(self, task=None):
-        for url in self.urls:
-            continue_response_generation = True
-            for plugin in self.plugins:
-                if hasattr(plugin, "stop_generation") and callable(getattr(plugin, "stop_generation")):
-                    plugin_response = getattr(plugin, "stop_generation")()
-                    if plugin_response:
-                        continue_response_generation = False
-                        break
+        if self.max_workers > 1 and len(self.urls) > 1:
+            self.crawl_concurrently(task)
+            return
 
-            if not continue_response_generation:
+        for i, url in enumerate(self.urls):
+            if self.stop_requested():
                 break
 
-            if self.verbose:
-                on_print(f"Fetching URL: {url}", Fore.WHITE + Style.DIM)
-            content = self.fetch_page(url)
-            if content:
-                # Check if the URL points to a PDF
-                if url.lower().endswith('.pdf'):
-                    if self.verbose:
-                        on_print(f"Extracting text from PDF: {url}", Fore.WHITE + Style.DIM)
-                    extracted_text = self.extract_text_from_pdf(content)
-                else:
-                    if self.verbose:
-                        on_print(f"Extracting text from HTML: {url}", Fore.WHITE + Style.DIM)
-                    decoded_content = self.decode_content(content)
-                    extracted_text = self.extract_text_from_html(decoded_content)
+            if self.get_remaining_time() == 0:
+                self.skipped_urls.extend(self.urls[i:])
+                break
 
-                article = {'url': url, 'text': extracted_text}
-                
-                if self.llm_enabled and task:
-                    if self.verbose:
-                        on_print(Fore.WHITE + Style.DIM + f"Using LLM to process the content. Task: {task}")
-                    llm_result = self.ask_llm(content=extracted_text, user_input=task)
-                    article['llm_result'] = llm_result
+            extracted_text = self.fetch_and_extract(url)
+            if extracted_text is not None:
+                self.add_article(url, extracted_text, task)
+            elif self.get_remaining_time() == 0:
+                self.skipped_urls.append(url)
+
+    def crawl_concurrently(self, task=None):
+        """
+        Fetch and extract pages in a thread pool, at most max_workers at once and max_workers_per_host per host.
+        Articles keep the order of the URLs, pages not fetched when the crawl is stopped are skipped.
+        """
+        results = [None] * len(self.urls)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(self.fetch_and_extract, url): i for i, url in enumerate(self.urls)}
+            pending = set(futures)
+            while pending:
+                remaining_time = self.get_remaining_time()
+                if remaining_time == 0:
+                    # Out of time: drop the pages still being fetched or extracted
+                    self.stop_event.set()
+                    for future in pending:
+                        future.cancel()
+                    self.skipped_urls.extend(self.urls[futures[future]] for future in sorted(pending, key=futures.get))
+                    break
 
-                self.articles.append(article)
+                done, pending = wait(pending, timeout=min(0.1, remaining_time) if remaining_time is not None else 0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        results[futures[future]] = future.result()
+                        if results[futures[future]] is None and self.get_remaining_time() == 0:
+                            self.skipped_urls.append(self.urls[futures[future]])
+                    except Exception as e:
+                        if self.verbose:
+                            on_print(f"Error crawling URL {self.urls[futures[future]]}: {e}", Fore.RED)
+
+                if pending and self.stop_requested():
+                    # Cancel fetches not started yet, running ones stop before extraction
+                    self.stop_event.set()
+                    for future in pending:
+                        future.cancel()
+                    break
+        finally:
+            executor.shutdown(wait=False)
+
+        for url, extracted_text in zip(self.urls, results):
+            if extracted_text is not None:
+                self.add_article(url, extracted_text, task)
 
     def get_articles(self):
         return self.articles
@@ -494,6 +1315,9 @@ def discover_plugins(plugin_folder=None):
                     if hasattr(obj, 'set_web_crawler') and callable(getattr(obj, 'set_web_crawler')):
                         plugin.set_web_crawler(SimpleWebCrawler)
 
+                    if hasattr(obj, 'set_http_session') and callable(getattr(obj, 'set_http_session')):
+                        plugin.set_http_session(get_http_session())  # Shared, pooled and cached HTTP session
+
                     if other_instance_url and hasattr(obj, 'set_other_instance_url') and callable(getattr(obj, 'set_other_instance_url')):
                         plugin.set_other_instance_url(other_instance_url)  # URL of the other instance to communicate with
                     
@@ -535,68 +1359,587 @@ def is_markdown(file_path):
     # If no Markdown features are found, assume it's a regular text file
     return False
 
-class MemoryManager:
-    def __init__(self, collection_name, chroma_client, selected_model, embedding_model_name, verbose=False, num_ctx=None, long_term_memory_file="long_term_memory.json"):
-        """
-        Initialize the MemoryManager with a specific ChromaDB collection.
+markdown_heading_pattern = re.compile(r'^[^\S\n]*#{1,6}[^\S\n]+\S', re.MULTILINE)
 
-        :param collection_name: The name of the ChromaDB collection used to store memory.
-        :param chroma_client: The ChromaDB client instance.
-        :param selected_model: The model used in ask_ollama for generating responses and embeddings.
-        :param embedding_model_name: The name of the embedding model for generating embeddings.
+def is_markdown_text(content):
+    """
+    Check if a text in memory looks like Markdown, using the same heading check as is_markdown.
+    """
+    return bool(markdown_heading_pattern.search(content))
+
+class EmbeddingCache:
+    def __init__(self, cache_file="embedding_cache.db", max_entries=100000):
         """
-        self.collection_name = collection_name
-        self.client = chroma_client
-        self.selected_model = selected_model
-        self.embedding_model_name = embedding_model_name
-        self.collection = self.client.get_or_create_collection(name=self.collection_name)
-        self.verbose = verbose
-        self.num_ctx = num_ctx
-        self.long_term_memory_manager = LongTermMemoryManager(selected_model, verbose, num_ctx, memory_file=long_term_memory_file)
+        Initialize a persistent embedding cache stored in a SQLite database.
 
-    def preprocess_conversation(self, conversation):
+        :param cache_file: The name of the SQLite file, created in the user data directory.
+        :param max_entries: Maximum number of embeddings to keep, least recently used entries are evicted first.
         """
-        Preprocess the conversation to filter out tool or function role entries, and then summarize key points.
+        dirs = AppDirs(APP_NAME, APP_AUTHOR, version=APP_VERSION)
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
 
-        :param conversation: The conversation array (list of role/content dictionaries).
-        :return: Summarized key points for the conversation.
+        self.cache_file = os.path.join(dirs.user_data_dir, cache_file)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, text_hash TEXT NOT NULL, embedding BLOB NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (model, text_hash))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self.connection.commit()
+        self.entry_count = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _hash_text(self, text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model, texts):
         """
-        # Convert conversation list of objects to a list of dict
-        conversation = [json.loads(json.dumps(obj, default=lambda o: vars(o))) for obj in conversation]
+        Look up the embeddings of a list of texts.
 
-        # Filter out tool/function roles
-        filtered_conversation = [entry for entry in conversation if entry['role'] not in ['system', 'tool', 'function']]
+        :return: A list with one embedding per text, None for texts that are not cached.
+        """
+        hashes = [self._hash_text(text) for text in texts]
+        found = {}
+
+        with self.lock:
+            # Stay well below SQLite's maximum number of bound parameters
+            for start in range(0, len(hashes), 500):
+                batch = list(set(hashes[start:start + 500]))
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(f"SELECT text_hash, embedding FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})", [model] + batch).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array('f', blob).tolist()
+
+            if found:
+                now = time.time()
+                self.connection.executemany("UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?", [(now, model, text_hash) for text_hash in found])
+                self.connection.commit()
+
+            embeddings = [found.get(text_hash) for text_hash in hashes]
+            hits = sum(1 for embedding in embeddings if embedding is not None)
+            self.hits += hits
+            self.misses += len(embeddings) - hits
+
+        return embeddings
+
+    def put_many(self, model, texts, embeddings):
+        """
+        Store the embeddings of a list of texts, evicting the least recently used entries if the cache is full.
+        """
+        now = time.time()
+        rows = [(model, self._hash_text(text), array('f', embedding).tobytes(), now) for text, embedding in zip(texts, embeddings) if embedding]
 
-        if len(filtered_conversation) == 0:
-            return ""
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO embeddings (model, text_hash, embedding, last_access) VALUES (?, ?, ?, ?)", rows)
+            self.entry_count += len(rows)
 
-        # Concatenate the filtered conversation into a single input (make sure entries contain 'role' and 'content' keys)
-        user_input = "\n".join([f"{entry['role']}: {entry['content']}" for entry in filtered_conversation if 'role' in entry and 'content' in entry])
+            if self.entry_count > self.max_entries:
+                self.entry_count = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                excess = self.entry_count - self.max_entries
+                if excess > 0:
+                    self.connection.execute("DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)", (excess,))
+                    self.entry_count -= excess
+                    self.evictions += excess
 
-        # Define an elaborated system prompt for the LLM to generate a high-quality summary
-        system_prompt = """
-        You are a memory assistant tasked with summarizing conversations for future reference. 
-        Your goal is to identify the key points, user intents, important questions, decisions made, and any personal information shared by the user.
-        Focus on gathering and summarizing:
-        - Core ideas and user questions
-        - Notable responses from the assistant or system
-        - Personal details shared by the user (e.g., family, life, location, occupation, interests)
-        - Any decisions, action points, or follow-up tasks
+            self.connection.commit()
 
-        When capturing personal details, organize them clearly for future context (e.g., 'User mentioned living in X city' or 'User has a family with two children').
-        Avoid excessive technical details, irrelevant tool-related content, or repetition.
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups > 0 else 0
+        return f"Embedding cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), {self.evictions} evictions, {self.entry_count} entries."
 
-        Important: ensure the summary is generated in conversation language.
+class OllamaClients:
+    """
+    Ollama clients shared by the whole application, one per role: "chat" for generations and model listing, "embed" for embeddings.
 
-        Conversation:
+    Each role has its own host, connection pool, timeout and keep-alive, so embeddings can be served by another Ollama instance and long generations do not hold the connections used by document indexing.
+    """
+    def __init__(self, chat_host=None, embed_host=None, chat_timeout=None, embed_timeout=None, chat_keep_alive=None, embed_keep_alive=None, chat_connections=4, embed_connections=10):
         """
+        :param chat_host: Ollama host of the chat client, None to use the OLLAMA_HOST environment variable or the default host.
+        :param embed_host: Ollama host of the embeddings client, None to use the chat host.
+        :param chat_timeout: Timeout in seconds of chat requests, None for no timeout.
+        :param embed_timeout: Timeout in seconds of embeddings requests, None for no timeout.
+        :param chat_keep_alive: How long the chat model stays loaded after a request (e.g. "5m", "-1" to keep it loaded), None for the server default.
+        :param embed_keep_alive: How long the embeddings model stays loaded after a request, None for the server default.
+        :param chat_connections: Maximum number of connections of the chat client pool.
+        :param embed_connections: Maximum number of connections of the embeddings client pool.
+        """
+        self.chat_keep_alive = chat_keep_alive
+        self.embed_keep_alive = embed_keep_alive
+        self.chat_client = ollama.Client(host=chat_host, timeout=chat_timeout, limits=httpx.Limits(max_connections=chat_connections, max_keepalive_connections=chat_connections))
+        self.embed_client = ollama.Client(host=embed_host or chat_host, timeout=embed_timeout, limits=httpx.Limits(max_connections=embed_connections, max_keepalive_connections=embed_connections))
 
-        # Use the ask_ollama function to summarize key points
-        summary = ask_ollama(system_prompt, user_input, self.selected_model, temperature=0.1, no_bot_prompt=True, stream_active=False, num_ctx=self.num_ctx)
-        
-        return summary
+    def chat(self, **kwargs):
+        if self.chat_keep_alive is not None and kwargs.get('keep_alive') is None:
+            kwargs['keep_alive'] = self.chat_keep_alive
+        return self.chat_client.chat(**kwargs)
 
-    def generate_embedding(self, text):
+    def embed(self, **kwargs):
+        if self.embed_keep_alive is not None and kwargs.get('keep_alive') is None:
+            kwargs['keep_alive'] = self.embed_keep_alive
+        return self.embed_client.embed(**kwargs)
+
+    def list(self):
+        return self.chat_client.list()
+
+def get_ollama_clients():
+    """
+    Return the Ollama clients registry created in run(), or a registry with the default settings when run() was not called.
+    """
+    global ollama_clients
+
+    if ollama_clients is None:
+        ollama_clients = OllamaClients(embed_connections=max(10, index_jobs))
+    return ollama_clients
+
+# Embeddings come from /api/embed, whose vectors are normalized: collections indexed with the former /api/embeddings endpoint do not match them
+embedding_api_version = "embed"
+mismatched_collections = set()
+
+def check_collection_embeddings(collection, model):
+    """
+    Record the embeddings endpoint in the metadata of an empty collection, or warn once when a collection was indexed with another endpoint.
+
+    :param model: The Ollama embeddings model used with the collection, None when ChromaDB embeds the documents with its default embedding function.
+    :return: True if the vectors of the collection were computed by the current embeddings endpoint.
+    """
+    # Collections embedded by ChromaDB never used the Ollama endpoints
+    if not model:
+        return True
+
+    metadata = collection.metadata or {}
+    if metadata.get('embedding_api') == embedding_api_version:
+        return True
+
+    if collection.count() == 0:
+        # The distance function cannot be changed, leave the hnsw settings out
+        metadata = {key: value for key, value in metadata.items() if not key.startswith('hnsw:')}
+        metadata['embedding_api'] = embedding_api_version
+        collection.modify(metadata=metadata)
+        return True
+
+    if collection.name not in mismatched_collections:
+        mismatched_collections.add(collection.name)
+        on_print(f"Collection {collection.name} was indexed with the former Ollama embeddings endpoint, its vectors do not match the embeddings of new documents and queries. Delete it with /rmcollection {collection.name} and index the documents again.", Fore.YELLOW)
+    return False
+
+def get_embeddings(texts, model):
+    """
+    Embed a list of texts with a single Ollama call, reusing cached embeddings when available.
+
+    :param texts: The texts to embed.
+    :param model: The embedding model name.
+    :return: A list with one embedding vector per text.
+    """
+    global embedding_cache
+
+    if embedding_cache:
+        embeddings = embedding_cache.get_many(model, texts)
+    else:
+        embeddings = [None] * len(texts)
+
+    missing_indexes = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing_indexes:
+        missing_texts = [texts[i] for i in missing_indexes]
+        response = get_ollama_clients().embed(
+            input=missing_texts,
+            model=model
+        )
+
+        for i, embedding in zip(missing_indexes, response["embeddings"]):
+            embeddings[i] = embedding
+
+        if embedding_cache:
+            embedding_cache.put_many(model, missing_texts, response["embeddings"])
+
+    return embeddings
+
+def get_embedding(text, model):
+    """
+    Embed a single text, reusing the cached embedding when available.
+    """
+    return get_embeddings([text], model)[0]
+
+class QueryExpansionCache:
+    def __init__(self, cache_file="query_expansion_cache.db", ttl=7 * 24 * 3600, max_entries=10000):
+        """
+        Initialize a persistent cache of query expansions stored in a SQLite database.
+
+        :param cache_file: The name of the SQLite file, created in the user data directory.
+        :param ttl: Number of seconds during which an expansion is reused, 0 for no expiration.
+        :param max_entries: Maximum number of expansions to keep, least recently used entries are evicted first.
+        """
+        dirs = AppDirs(APP_NAME, APP_AUTHOR, version=APP_VERSION)
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+
+        self.cache_file = os.path.join(dirs.user_data_dir, cache_file)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS expansions (model TEXT NOT NULL, query_hash TEXT NOT NULL, expansion TEXT NOT NULL, created REAL NOT NULL DEFAULT 0, last_access REAL NOT NULL, PRIMARY KEY (model, query_hash))")
+        # Caches created before expansions expired have no creation time, their entries are treated as expired
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(expansions)")]
+        if 'created' not in columns:
+            self.connection.execute("ALTER TABLE expansions ADD COLUMN created REAL NOT NULL DEFAULT 0")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS expansions_last_access ON expansions (last_access)")
+        self.connection.commit()
+
+    def _hash_query(self, question, question_context):
+        return hashlib.sha256(json.dumps([question, question_context or ""]).encode('utf-8')).hexdigest()
+
+    def get(self, model, question, question_context=None):
+        """
+        Look up the expansion of a question.
+
+        :return: The cached expansion, or None if the question was never expanded with this model and context.
+        """
+        query_hash = self._hash_query(question, question_context)
+        model = model or ""
+        now = time.time()
+
+        with self.lock:
+            row = self.connection.execute("SELECT expansion, created FROM expansions WHERE model = ? AND query_hash = ?", (model, query_hash)).fetchone()
+            if row is not None and self.ttl > 0 and row[1] < now - self.ttl:
+                self.connection.execute("DELETE FROM expansions WHERE model = ? AND query_hash = ?", (model, query_hash))
+                self.connection.commit()
+                self.evictions += 1
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.connection.execute("UPDATE expansions SET last_access = ? WHERE model = ? AND query_hash = ?", (now, model, query_hash))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, model, question, question_context, expansion):
+        """
+        Store the expansion of a question, evicting expired entries, then the least recently used entries if the cache is full.
+        """
+        query_hash = self._hash_query(question, question_context)
+        model = model or ""
+        now = time.time()
+
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO expansions (model, query_hash, expansion, created, last_access) VALUES (?, ?, ?, ?, ?)", (model, query_hash, expansion, now, now))
+            if self.ttl > 0:
+                self.evictions += self.connection.execute("DELETE FROM expansions WHERE created < ?", (now - self.ttl,)).rowcount
+            self.evictions += self.connection.execute("DELETE FROM expansions WHERE rowid IN (SELECT rowid FROM expansions ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+            self.connection.commit()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups > 0 else 0
+        return f"Query expansion cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), {self.evictions} evictions."
+
+class LlmResponseCache:
+    def __init__(self, cache_file="llm_response_cache.db", ttl=7 * 24 * 3600, max_entries=10000):
+        """
+        Initialize a persistent cache of the answers of helper LLM calls (reasoning plans, tool routing, memory extraction), stored in a SQLite database.
+
+        :param cache_file: The name of the SQLite file, created in the user data directory.
+        :param ttl: Number of seconds during which an answer is reused, 0 for no expiration.
+        :param max_entries: Maximum number of answers to keep, least recently used entries are evicted first.
+        """
+        dirs = AppDirs(APP_NAME, APP_AUTHOR, version=APP_VERSION)
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+
+        self.cache_file = os.path.join(dirs.user_data_dir, cache_file)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Hits and misses per purpose of the helper call
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses (request_hash TEXT PRIMARY KEY, purpose TEXT NOT NULL, response TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.connection.commit()
+
+    def _hash_request(self, model, options, system_prompt, user_input):
+        return hashlib.sha256(json.dumps([model or "", options, system_prompt, user_input], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, purpose, model, options, system_prompt, user_input):
+        """
+        Look up the answer of a helper call.
+
+        :param purpose: The purpose of the call, hits and misses are counted per purpose.
+        :return: The cached answer, or None if the same request was not answered before or its answer expired.
+        """
+        request_hash = self._hash_request(model, options, system_prompt, user_input)
+        now = time.time()
+
+        with self.lock:
+            row = self.connection.execute("SELECT response, created FROM responses WHERE request_hash = ?", (request_hash,)).fetchone()
+            if row is not None and self.ttl > 0 and row[1] < now - self.ttl:
+                self.connection.execute("DELETE FROM responses WHERE request_hash = ?", (request_hash,))
+                self.connection.commit()
+                self.evictions += 1
+                row = None
+
+            if row is None:
+                self.misses[purpose] = self.misses.get(purpose, 0) + 1
+                return None
+
+            self.hits[purpose] = self.hits.get(purpose, 0) + 1
+            self.connection.execute("UPDATE responses SET last_access = ? WHERE request_hash = ?", (now, request_hash))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, purpose, model, options, system_prompt, user_input, response):
+        """
+        Store the answer of a helper call, evicting expired entries, then the least recently used entries if the cache is full.
+        """
+        request_hash = self._hash_request(model, options, system_prompt, user_input)
+        now = time.time()
+
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO responses (request_hash, purpose, response, created, last_access) VALUES (?, ?, ?, ?, ?)", (request_hash, purpose, response, now, now))
+            if self.ttl > 0:
+                self.evictions += self.connection.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+            self.evictions += self.connection.execute("DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+            self.connection.commit()
+
+    def get_stats(self):
+        hits = sum(self.hits.values())
+        lookups = hits + sum(self.misses.values())
+        hit_rate = (hits / lookups * 100) if lookups > 0 else 0
+        purposes = []
+        for purpose in sorted(set(self.hits) | set(self.misses)):
+            purpose_hits = self.hits.get(purpose, 0)
+            purpose_lookups = purpose_hits + self.misses.get(purpose, 0)
+            purposes.append(f"{purpose}: {purpose_hits}/{purpose_lookups} ({purpose_hits / purpose_lookups * 100:.1f}%)")
+        details = f" Per purpose: {', '.join(purposes)}." if purposes else ""
+        return f"LLM response cache: {hits} hits, {lookups - hits} misses ({hit_rate:.1f}% hit rate), {self.evictions} evictions.{details}"
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens of a text, about 4 characters per token for English text with the usual tokenizers.
+    """
+    return (len(text) + 3) // 4
+
+def get_message_field(message, field):
+    """
+    Read a field of a conversation message, either a dict or a message object such as the ChatCompletionMessage appended to the conversation by OpenAI tool calls.
+    """
+    if isinstance(message, dict):
+        return message.get(field)
+    return getattr(message, field, None)
+
+def copy_message(message):
+    """
+    Copy a conversation message so that it can be modified, message objects are never modified and are kept as is.
+    """
+    return dict(message) if isinstance(message, dict) else message
+
+class ConversationWindow:
+    # Tokens added by the chat template around every message
+    message_overhead = 4
+
+    def __init__(self, budget=0, keep_turns=4, selected_model=None, num_ctx=None, verbose=False):
+        """
+        Keep a conversation within a token budget: the system message is pinned, the last turns are kept verbatim, and older turns are folded into a summary updated every time the budget is crossed.
+
+        :param budget: Maximum number of tokens of the conversation sent to the model, 0 to never fold turns.
+        :param keep_turns: Number of recent turns (a user message and the messages answering it) always kept verbatim.
+        :param selected_model: The model writing the summary.
+        :param num_ctx: The context window size of the model, used by ask_ollama for the summary.
+        """
+        self.budget = budget
+        self.keep_turns = max(1, keep_turns)
+        self.selected_model = selected_model
+        self.num_ctx = num_ctx
+        self.verbose = verbose
+        self.summary = ""
+        self.summary_message = None
+        self.folded_turns = 0
+        # Token count of every message, by message identity, recomputed when the content of a message changes
+        self.token_counts = {}
+
+    def count_message_tokens(self, message):
+        content = get_message_field(message, 'content') or ""
+        if not isinstance(content, str):
+            content = json.dumps(content, default=str)
+        tool_calls = get_message_field(message, 'tool_calls')
+        if tool_calls:
+            content += json.dumps(tool_calls, default=lambda o: vars(o))
+
+        cached = self.token_counts.get(id(message))
+        if cached and cached[0] is message and cached[1] == len(content):
+            return cached[2]
+
+        tokens = estimate_tokens(content) + self.message_overhead
+        self.token_counts[id(message)] = (message, len(content), tokens)
+        return tokens
+
+    def split(self, conversation):
+        """
+        Split a conversation into its parts.
+
+        :return: A tuple (system messages, summary message or None, list of turns), each turn being a list of messages starting with a user message.
+        """
+        if self.summary_message is not None and not any(message is self.summary_message for message in conversation):
+            # The conversation was reset
+            self.summary = ""
+            self.summary_message = None
+            self.folded_turns = 0
+
+        pinned = []
+        summary_message = None
+        turns = []
+        for message in conversation:
+            role = get_message_field(message, 'role')
+            if message is self.summary_message:
+                summary_message = message
+            elif not turns and role == 'system':
+                pinned.append(message)
+            elif role == 'user' or not turns:
+                turns.append([message])
+            else:
+                turns[-1].append(message)
+
+        return pinned, summary_message, turns
+
+    def apply(self, conversation):
+        """
+        Fold the oldest turns of the conversation into the summary if the conversation exceeds the budget. The conversation is updated in place.
+        """
+        if self.budget <= 0:
+            return
+
+        total_tokens = sum(self.count_message_tokens(message) for message in conversation)
+        if total_tokens <= self.budget:
+            return
+
+        pinned, summary_message, turns = self.split(conversation)
+        if len(turns) <= self.keep_turns:
+            if self.verbose:
+                on_print(f"Conversation uses {total_tokens} tokens, over the budget of {self.budget} tokens, but only contains the last {len(turns)} turns.", Fore.WHITE + Style.DIM)
+            return
+
+        folded = turns[:-self.keep_turns]
+        kept = turns[-self.keep_turns:]
+        folded_text = "\n".join(f"{get_message_field(message, 'role')}: {get_message_field(message, 'content')}" for turn in folded for message in turn if get_message_field(message, 'content') and get_message_field(message, 'role') != 'tool')
+
+        system_prompt = "You maintain a running summary of a conversation between a user and an assistant. You are given the current summary, possibly empty, and the next exchanges of the conversation. Write the updated summary: keep the facts, user preferences, decisions, open questions and any detail the assistant may need later, drop greetings and repetitions. Answer with the summary only, in a few short paragraphs or bullet points."
+        user_input = f"Current summary:\n{self.summary or '(empty)'}\n\nNext exchanges:\n{folded_text}"
+        summary = ask_ollama(system_prompt, user_input, self.selected_model, temperature=0.1, no_bot_prompt=True, stream_active=False, num_ctx=self.num_ctx, cache_purpose="conversation_summary")
+        if not summary:
+            if self.verbose:
+                on_print("The conversation summary could not be updated, older turns are kept.", Fore.WHITE + Style.DIM)
+            return
+
+        self.summary = summary
+        self.folded_turns += len(folded)
+        # Models without system role support get the system message merged into the first user message, keep the summary as a user message for them
+        role = "user" if no_system_role else "system"
+        self.summary_message = {"role": role, "content": f"Summary of the earlier conversation:\n{summary}"}
+
+        conversation[:] = pinned + [self.summary_message] + [message for turn in kept for message in turn]
+        self.token_counts = {key: value for key, value in self.token_counts.items() if any(value[0] is message for message in conversation)}
+
+        if self.verbose:
+            on_print(f"Folded {len(folded)} turns into the conversation summary, {total_tokens} tokens reduced to {sum(self.count_message_tokens(message) for message in conversation)} tokens.", Fore.WHITE + Style.DIM)
+
+    def get_report(self, conversation, num_ctx=None):
+        """
+        Describe the number of tokens used by each part of the conversation.
+        """
+        pinned, summary_message, turns = self.split(conversation)
+        system_tokens = sum(self.count_message_tokens(message) for message in pinned)
+        summary_tokens = self.count_message_tokens(summary_message) if summary_message else 0
+        kept_turns = turns[-self.keep_turns:] if self.budget > 0 else turns
+        older_turns = turns[:len(turns) - len(kept_turns)]
+        recent_tokens = sum(self.count_message_tokens(message) for turn in kept_turns for message in turn)
+        older_tokens = sum(self.count_message_tokens(message) for turn in older_turns for message in turn)
+        total_tokens = system_tokens + summary_tokens + recent_tokens + older_tokens
+
+        lines = [f"System prompt: {system_tokens} tokens"]
+        if summary_message:
+            lines.append(f"Summary of {self.folded_turns} earlier turns: {summary_tokens} tokens")
+        if older_turns:
+            lines.append(f"Older turns ({len(older_turns)}): {older_tokens} tokens")
+        lines.append(f"Recent turns ({len(kept_turns)}): {recent_tokens} tokens")
+        lines.append(f"Total: {total_tokens} tokens (estimated)")
+        lines.append(f"Budget: {self.budget} tokens" if self.budget > 0 else "Budget: none, older turns are never summarized")
+        lines.append(f"Context window: {num_ctx} tokens" if num_ctx else "Context window: model default")
+        return "\n".join(lines)
+
+class MemoryManager:
+    def __init__(self, collection_name, chroma_client, selected_model, embedding_model_name, verbose=False, num_ctx=None, long_term_memory_file="long_term_memory.json"):
+        """
+        Initialize the MemoryManager with a specific ChromaDB collection.
+
+        :param collection_name: The name of the ChromaDB collection used to store memory.
+        :param chroma_client: The ChromaDB client instance.
+        :param selected_model: The model used in ask_ollama for generating responses and embeddings.
+        :param embedding_model_name: The name of the embedding model for generating embeddings.
+        """
+        self.collection_name = collection_name
+        self.client = chroma_client
+        self.selected_model = selected_model
+        self.embedding_model_name = embedding_model_name
+        self.collection = self.client.get_or_create_collection(name=self.collection_name)
+        check_collection_embeddings(self.collection, embedding_model_name)
+        self.verbose = verbose
+        self.num_ctx = num_ctx
+        self.long_term_memory_manager = LongTermMemoryManager(selected_model, verbose, num_ctx, memory_file=long_term_memory_file)
+
+    def preprocess_conversation(self, conversation):
+        """
+        Preprocess the conversation to filter out tool or function role entries, and then summarize key points.
+
+        :param conversation: The conversation array (list of role/content dictionaries).
+        :return: Summarized key points for the conversation.
+        """
+        # Convert conversation list of objects to a list of dict
+        conversation = [json.loads(json.dumps(obj, default=lambda o: vars(o))) for obj in conversation]
+
+        # Filter out tool/function roles
+        filtered_conversation = [entry for entry in conversation if entry['role'] not in ['system', 'tool', 'function']]
+
+        if len(filtered_conversation) == 0:
+            return ""
+
+        # Concatenate the filtered conversation into a single input (make sure entries contain 'role' and 'content' keys)
+        user_input = "\n".join([f"{entry['role']}: {entry['content']}" for entry in filtered_conversation if 'role' in entry and 'content' in entry])
+
+        # Define an elaborated system prompt for the LLM to generate a high-quality summary
+        system_prompt = """
+        You are a memory assistant tasked with summarizing conversations for future reference. 
+        Your goal is to identify the key points, user intents, important questions, decisions made, and any personal information shared by the user.
+        Focus on gathering and summarizing:
+        - Core ideas and user questions
+        - Notable responses from the assistant or system
+        - Personal details shared by the user (e.g., family, life, location, occupation, interests)
+        - Any decisions, action points, or follow-up tasks
+
+        When capturing personal details, organize them clearly for future context (e.g., 'User mentioned living in X city' or 'User has a family with two children').
+        Avoid excessive technical details, irrelevant tool-related content, or repetition.
+
+        Important: ensure the summary is generated in conversation language.
+
+        Conversation:
+        """
+
+        # Use the ask_ollama function to summarize key points
+        summary = ask_ollama(system_prompt, user_input, self.selected_model, temperature=0.1, no_bot_prompt=True, stream_active=False, num_ctx=self.num_ctx)
+        
+        return summary
+
+    def generate_embedding(self, text):
         """
         Generate embeddings for a given text using the specified embedding model.
         
@@ -605,11 +1948,7 @@ class MemoryManager:
         """
         embedding = None
         if self.embedding_model_name:
-            response = ollama.embeddings(
-                prompt=text,
-                model=self.embedding_model_name
-            )
-            embedding = response["embedding"]
+            embedding = get_embedding(text, self.embedding_model_name)
         return embedding
 
     def add_memory(self, conversation, metadata=None):
@@ -712,13 +2051,14 @@ class MemoryManager:
 
     def handle_user_query(self, conversation, query=None):
         """
-        Handle a user query by updating the 'system' part of the conversation with relevant memories in XML markup.
-        
+        Handle a user query by retrieving the relevant memories, formatted in XML markup.
+
+        The conversation is not modified: the memories change with every query, they are sent after the stable part of the conversation with add_ephemeral_context().
+
         :param conversation: The current conversation array (list of role/content dictionaries).
-        :return: Updated conversation with a modified system prompt containing memory placeholders in XML format.
+        :param query: The query used when the conversation does not contain any user message.
+        :return: The memory section, or an empty string if no relevant memory was found.
         """
-        import json
-
         # Find the latest user input from the conversation (role 'user')
         user_input = query
         for entry in reversed(conversation):
@@ -727,51 +2067,32 @@ class MemoryManager:
                 break
 
         if not user_input or len(user_input.strip()) == 0:
-            return
+            return ""
 
         # Retrieve relevant memories based on the current user query
         relevant_memories, memory_metadata = self.retrieve_relevant_memory(user_input)
 
-        # Find the existing 'system' prompt in the conversation
-        system_prompt_entry = None
-        for entry in conversation:
-            if entry['role'] == 'system':
-                system_prompt_entry = entry
-                break
-
-        if system_prompt_entry:
-            # Keep the initial system prompt unchanged and remove the old memory section
-            original_system_prompt = system_prompt_entry['content']
+        # Define the memory section using XML-style tags
+        memory_start_tag = "<short-term-memories>"
+        memory_end_tag = "</short-term-memories>"
 
-            # Define the memory section using XML-style tags
-            memory_start_tag = "<short-term-memories>"
-            memory_end_tag = "</short-term-memories>"
-            
-            # Remove any previous memory section if it exists
-            if memory_start_tag in original_system_prompt:
-                original_system_prompt = original_system_prompt.split(memory_start_tag)[0].strip()
+        # Format the new memory content in XML markup, including metadata serialization
+        memory_text = ""
+        for i, memory in enumerate(relevant_memories):
+            metadata_str = json.dumps(memory_metadata[i], indent=2) if i < len(memory_metadata) else "{}"
+            memory_text += f"Memory {i+1}:\n{memory}\nMetadata: {metadata_str}\n\n"
 
-            # Format the new memory content in XML markup, including metadata serialization
-            memory_text = ""
-            for i, memory in enumerate(relevant_memories):
-                metadata_str = json.dumps(memory_metadata[i], indent=2) if i < len(memory_metadata) else "{}"
-                memory_text += f"Memory {i+1}:\n{memory}\nMetadata: {metadata_str}\n\n"
+        if not memory_text:
+            if self.verbose:
+                on_print("No relevant memories found for the user query.", Fore.WHITE + Style.DIM)
+            return ""
 
-            if memory_text:
-                memory_section = f"{memory_start_tag}\nIn the past we talked about...\n{memory_text.strip()}\n{memory_end_tag}"
+        memory_section = f"{memory_start_tag}\nIn the past we talked about...\n{memory_text.strip()}\n{memory_end_tag}"
 
-                # Update the system prompt with the new memory section
-                system_prompt_entry['content'] = f"{original_system_prompt}\n\n{memory_section}"
+        if self.verbose:
+            on_print(f"Relevant memories found:\n{memory_section}", Fore.WHITE + Style.DIM)
 
-                if self.verbose:
-                    on_print(f"System prompt updated with relevant memories:\n{system_prompt_entry['content']}", Fore.WHITE + Style.DIM)
-            else:
-                if self.verbose:
-                    on_print("No relevant memories found for the user query.", Fore.WHITE + Style.DIM)
-                system_prompt_entry['content'] = original_system_prompt
-        else:
-            # If no system prompt exists, raise an exception (or create one, depending on desired behavior)
-            raise ValueError("No system prompt found in the conversation")
+        return memory_section
 
 class LongTermMemoryManager:
     def __init__(self, selected_model, verbose=False, num_ctx=None, memory_file="long_term_memory.json"):
@@ -834,7 +2155,7 @@ class LongTermMemoryManager:
 
         # Step 1: Extract key-value information
         system_prompt_extract = self._get_extraction_prompt()
-        extracted_info = extract_json(ask_ollama(system_prompt_extract, conversation_str, self.selected_model, temperature=0.1, no_bot_prompt=True, stream_active=False, num_ctx=self.num_ctx))
+        extracted_info = extract_json(ask_ollama(system_prompt_extract, conversation_str, self.selected_model, temperature=0.1, no_bot_prompt=True, stream_active=False, num_ctx=self.num_ctx, cache_purpose="memory_extraction"))
 
         if self.verbose:
             on_print(f"Extracted information: {extracted_info}", Fore.WHITE + Style.DIM)
@@ -842,7 +2163,7 @@ class LongTermMemoryManager:
         # Step 2: Check for contradictions with existing memory
         existing_memory = self.memory["users"].get(user_id, {})
         system_prompt_conflict = self._get_conflict_check_prompt(existing_memory, conversation_str)
-        conflicting_info = extract_json(ask_ollama(system_prompt_conflict, conversation_str, self.selected_model, temperature=0.1, no_bot_prompt=True, stream_active=False, num_ctx=self.num_ctx))
+        conflicting_info = extract_json(ask_ollama(system_prompt_conflict, conversation_str, self.selected_model, temperature=0.1, no_bot_prompt=True, stream_active=False, num_ctx=self.num_ctx, cache_purpose="memory_conflicts"))
 
         # Remove conflicting info from memory if flagged by GPT
         if conflicting_info:
@@ -930,34 +2251,625 @@ def retrieve_relevant_memory(query_text, top_k=3):
 
     return memory_manager.retrieve_relevant_memory(query_text, top_k)
 
+def read_text_file(file_path):
+    """
+    Read the content of a text file, returns None if the file cannot be decoded.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        try:
+            return file.read()
+        except:
+            return None
+
+def chunk_file(file_path, allow_chunks=True, split_paragraphs=False, previous_content_hash=None, chunk_size=1000):
+    """
+    Read and chunk a text file. Runs in a worker process when indexing with several jobs.
+
+    :param file_path: The path of the file to read.
+    :param allow_chunks: Whether to chunk the document, otherwise the whole document is returned as a single chunk.
+    :param split_paragraphs: Whether to split markdown content into paragraphs.
+    :param previous_content_hash: Content hash of the previously indexed version of the file, if any.
+    :param chunk_size: Maximum chunk size in characters.
+    :return: A tuple (content_hash, chunks), chunks is None if the content hash did not change. None if the file could not be read.
+    """
+    content = read_text_file(file_path)
+
+    if not content:
+        return None
+
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    if content_hash == previous_content_hash:
+        return content_hash, None
+
+    if not allow_chunks:
+        return content_hash, [content]
+
+    return content_hash, chunk_text(content, split_paragraphs=split_paragraphs, chunk_size=chunk_size, markdown=is_markdown(file_path))
+
+def chunk_text(content, split_paragraphs=False, chunk_size=1000, markdown=False):
+    """
+    Chunk a text in memory.
+
+    :param content: The text to chunk.
+    :param split_paragraphs: Whether to split markdown content into paragraphs.
+    :param chunk_size: Maximum chunk size in characters.
+    :param markdown: Whether the text is Markdown, split into sections instead of fixed-size chunks.
+    :return: The list of chunks.
+    """
+    # Split Markdown content into sections if needed
+    if markdown:
+        markdown_splitter = MarkdownSplitter(content, split_paragraphs=split_paragraphs, max_chunk_size=chunk_size)
+        return markdown_splitter.split()
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_size // 10)
+    return text_splitter.split_text(content)
+
+def hash_text_file(file_path, block_size=1024 * 1024):
+    """
+    Compute the content hash of a text file without loading it whole, returns None if the file is empty or cannot be decoded.
+    """
+    content_hash = hashlib.sha256()
+    empty = True
+
+    with open(file_path, 'r', encoding='utf-8') as file:
+        try:
+            for block in iter(lambda: file.read(block_size), ''):
+                content_hash.update(block.encode('utf-8'))
+                empty = False
+        except:
+            return None
+
+    if empty:
+        return None
+    return content_hash.hexdigest()
+
+def iter_text_chunks(file, chunk_size=1000, chunk_overlap=100, block_size=1024 * 1024):
+    """
+    Split a text file into chunks, reading it block by block.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    remainder = ""
+    for block in iter(lambda: file.read(block_size), ''):
+        buffer = remainder + block
+        chunks = text_splitter.split_text(buffer)
+        if not chunks:
+            remainder = ""
+            continue
+
+        # The last chunk may be cut by the block boundary, split it again together with the next block
+        last_chunk = chunks.pop()
+        last_chunk_position = buffer.rfind(last_chunk)
+        remainder = buffer[last_chunk_position:] if last_chunk_position >= 0 else last_chunk + "\n"
+
+        yield from chunks
+
+    yield from text_splitter.split_text(remainder)
+
+def iter_file_chunks(file_path, split_paragraphs=False, chunk_size=1000):
+    """
+    Yield the chunks of a text file, reading it lazily so that memory usage does not depend on the file size.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        if is_markdown(file_path):
+            yield from MarkdownSplitter("", split_paragraphs=split_paragraphs, max_chunk_size=chunk_size).iter_split(file)
+        else:
+            yield from iter_text_chunks(file, chunk_size=chunk_size, chunk_overlap=chunk_size // 10)
+
+def chunk_large_file(file_path, split_paragraphs=False, previous_content_hash=None, chunk_size=1000):
+    """
+    Same as chunk_file for files too large to be loaded in memory, chunks are returned as a generator.
+    """
+    content_hash = hash_text_file(file_path)
+
+    if not content_hash:
+        return None
+
+    if content_hash == previous_content_hash:
+        return content_hash, None
+
+    return content_hash, iter_file_chunks(file_path, split_paragraphs=split_paragraphs, chunk_size=chunk_size)
+
+class IndexManifest:
+    def __init__(self, collection_name, database_id="", manifest_file="index_manifest.db"):
+        """
+        Initialize the manifest of files indexed into a ChromaDB collection.
+
+        :param collection_name: The name of the ChromaDB collection the manifest belongs to.
+        :param database_id: The location of the ChromaDB database of the collection, see get_chroma_database_id(), collections with the same name in different databases get their own manifest.
+        :param manifest_file: The name of the SQLite file, created in the user data directory.
+        """
+        dirs = AppDirs(APP_NAME, APP_AUTHOR, version=APP_VERSION)
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+
+        self.collection_name = collection_name
+        self.database_id = database_id
+        self.manifest_file = os.path.join(dirs.user_data_dir, manifest_file)
+        self.pending_updates = 0
+
+        self.connection = sqlite3.connect(self.manifest_file, check_same_thread=False)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(files)")]
+        if columns and 'database' not in columns:
+            # Entries of manifests without the database cannot be attributed, the files are indexed again
+            self.connection.execute("DROP TABLE files")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files (database TEXT NOT NULL, collection TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL, content_hash TEXT NOT NULL, settings TEXT NOT NULL, chunk_ids TEXT NOT NULL, PRIMARY KEY (database, collection, path))")
+        self.connection.commit()
+
+    def get_entries(self, root_folder):
+        """
+        Return the manifest entries of all files located under the root folder, by absolute path.
+        """
+        root_prefix = os.path.join(os.path.abspath(root_folder), "")
+        entries = {}
+        for path, size, mtime, content_hash, settings, chunk_ids in self.connection.execute("SELECT path, size, mtime, content_hash, settings, chunk_ids FROM files WHERE database = ? AND collection = ?", (self.database_id, self.collection_name)):
+            if path.startswith(root_prefix):
+                entries[path] = {'size': size, 'mtime': mtime, 'content_hash': content_hash, 'settings': settings, 'chunk_ids': json.loads(chunk_ids)}
+        return entries
+
+    def update(self, file_path, size, mtime, content_hash, settings, chunk_ids):
+        self.connection.execute("INSERT OR REPLACE INTO files (database, collection, path, size, mtime, content_hash, settings, chunk_ids) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (self.database_id, self.collection_name, os.path.abspath(file_path), size, mtime, content_hash, settings, json.dumps(chunk_ids)))
+        self._commit_periodically()
+
+    def remove(self, file_path):
+        self.connection.execute("DELETE FROM files WHERE database = ? AND collection = ? AND path = ?", (self.database_id, self.collection_name, os.path.abspath(file_path)))
+        self._commit_periodically()
+
+    def clear(self):
+        self.connection.execute("DELETE FROM files WHERE database = ? AND collection = ?", (self.database_id, self.collection_name))
+        self.connection.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_updates = 0
+
+    def _commit_periodically(self):
+        # Committing every row would dominate indexing time on large folders
+        self.pending_updates += 1
+        if self.pending_updates >= 1000:
+            self.commit()
+
+class KeywordIndex:
+    # Longer queries, e.g. expanded questions, match most of the collection and drown the relevant chunks
+    max_query_terms = 12
+
+    def __init__(self, collection_name, database_id="", index_file="keyword_index.db"):
+        """
+        Initialize a persistent full-text index (SQLite FTS5, BM25 ranking) of the chunks stored in a ChromaDB collection.
+
+        :param collection_name: The name of the ChromaDB collection the index belongs to.
+        :param database_id: The location of the ChromaDB database of the collection, see get_chroma_database_id(), collections with the same name in different databases get their own index.
+        :param index_file: The name of the SQLite file, created in the user data directory.
+        """
+        dirs = AppDirs(APP_NAME, APP_AUTHOR, version=APP_VERSION)
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+
+        self.collection_name = collection_name
+        self.database_id = database_id
+        self.index_file = os.path.join(dirs.user_data_dir, index_file)
+        self.lock = threading.Lock()
+
+        # Collection names are not valid SQL identifiers, derive the table names from their hash
+        table_key = f"{database_id}\n{collection_name}" if database_id else collection_name
+        table_suffix = hashlib.sha1(table_key.encode('utf-8')).hexdigest()[:16]
+        self.chunks_table = f"chunks_{table_suffix}"
+        self.fts_table = f"fts_{table_suffix}"
+
+        self.connection = sqlite3.connect(self.index_file, check_same_thread=False)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {self.chunks_table} (id INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE)")
+        self.connection.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5(content)")
+        self.connection.commit()
+
+    def upsert(self, ids, contents):
+        """
+        Add or replace chunks in the index.
+
+        :param ids: The chunk ids.
+        :param contents: The text indexed for each chunk, usually the tokens computed by preprocess_text.
+        """
+        with self.lock:
+            self._delete(ids)
+            for chunk_id, content in zip(ids, contents):
+                cursor = self.connection.execute(f"INSERT INTO {self.chunks_table} (chunk_id) VALUES (?)", (chunk_id,))
+                self.connection.execute(f"INSERT INTO {self.fts_table} (rowid, content) VALUES (?, ?)", (cursor.lastrowid, content))
+            self.connection.commit()
+
+    def delete(self, ids):
+        with self.lock:
+            self._delete(ids)
+            self.connection.commit()
+
+    def _delete(self, ids):
+        for chunk_id in ids:
+            row = self.connection.execute(f"SELECT id FROM {self.chunks_table} WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row:
+                self.connection.execute(f"DELETE FROM {self.fts_table} WHERE rowid = ?", row)
+                self.connection.execute(f"DELETE FROM {self.chunks_table} WHERE id = ?", row)
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute(f"DELETE FROM {self.fts_table}")
+            self.connection.execute(f"DELETE FROM {self.chunks_table}")
+            self.connection.commit()
+
+    def is_empty(self):
+        with self.lock:
+            return self.connection.execute(f"SELECT 1 FROM {self.chunks_table} LIMIT 1").fetchone() is None
+
+    def search(self, terms, n_results=25):
+        """
+        Return the ids of the chunks best matching any of the terms, ranked by BM25 over the whole collection.
+        """
+        terms = [term for term in dict.fromkeys(terms) if term and term not in stop_words][:self.max_query_terms]
+        if not terms:
+            return []
+
+        # Quote every term so that punctuation (error codes, part numbers...) is matched as a phrase instead of parsed as FTS5 syntax
+        fts_query = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+        with self.lock:
+            try:
+                rows = self.connection.execute(f"SELECT c.chunk_id FROM {self.fts_table} f JOIN {self.chunks_table} c ON c.id = f.rowid WHERE {self.fts_table} MATCH ? ORDER BY bm25({self.fts_table}) LIMIT ?", (fts_query, n_results)).fetchall()
+            except sqlite3.OperationalError:
+                return []
+
+        return [row[0] for row in rows]
+
+def get_chroma_database_id(client):
+    """
+    Identify the database of a ChromaDB client: the absolute path of a persistent database, or the host and port of a server.
+    """
+    if client is None:
+        return ""
+
+    settings = client.get_settings()
+    if settings.is_persistent:
+        return os.path.abspath(settings.persist_directory)
+    return f"{settings.chroma_server_host}:{settings.chroma_server_http_port}"
+
+def get_keyword_index(collection_name, client=None):
+    """
+    Return the keyword index of a collection, or None if keyword indexing is disabled or unavailable (SQLite without FTS5).
+
+    :param client: The ChromaDB client of the collection, the global client if not specified.
+    """
+    global keyword_indexes
+
+    if not use_keyword_index or not collection_name:
+        return None
+
+    database_id = get_chroma_database_id(client or chroma_client)
+    key = (database_id, collection_name)
+    if key not in keyword_indexes:
+        try:
+            keyword_indexes[key] = KeywordIndex(collection_name, database_id)
+        except sqlite3.OperationalError as e:
+            if verbose_mode:
+                on_print(f"Keyword index not available: {e}", Fore.WHITE + Style.DIM)
+            keyword_indexes[key] = None
+
+    return keyword_indexes[key]
+
+def get_file_document_id(file_path):
+    """
+    Build the document id of an indexed file from its name and a hash of its absolute path, so files with the same name in different folders do not share chunk ids.
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    path_hash = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:12]
+    return f"{name}_{path_hash}"
+
 class DocumentIndexer:
-    def __init__(self, root_folder, collection_name, chroma_client, embeddings_model):
+    def __init__(self, root_folder, collection_name, chroma_client, embeddings_model, batch_size=0, incremental=False, jobs=1, chunk_size=1000):
         self.root_folder = root_folder
         self.collection_name = collection_name
         self.client = chroma_client
         self.model = embeddings_model
         self.collection = self.client.get_or_create_collection(name=self.collection_name)
+        check_collection_embeddings(self.collection, embeddings_model)
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.jobs = max(1, jobs)
+        self.chunk_size = chunk_size
+        self.keyword_index = get_keyword_index(collection_name, chroma_client)
+        self.pending_ids = []
+        self.pending_documents = []
+        self.pending_metadatas = []
+
+        # The indexing pipeline hands chunks over to the embedding workers in batches
+        if self.jobs > 1 and self.batch_size <= 0:
+            self.batch_size = 32
+
+        self.embedding_queue = None
+        self.write_queue = None
+        self.embedding_workers = []
+        self.writer = None
+        self.pipeline_error = None
+
+        # Chunks of each file not written to the collection yet, the manifest entry of a file is only updated once all its chunks are written
+        self.unwritten_chunks = {}
+        self.unwritten_chunk_files = {}
+        # Files whose chunks are still being produced, large files being chunked while their first chunks are written
+        self.open_files = set()
+        self.written_files = deque()
+        self.written_lock = threading.Lock()
+
+    def get_text_files(self):
+        """
+        Recursively find all .txt and .md files in the root folder.
+        """
+        text_files = []
+        for root, dirs, files in os.walk(self.root_folder):
+            for file in files:
+                if file.endswith(".txt") or file.endswith(".md") or file.endswith(".tex"):
+                    text_files.append(os.path.join(root, file))
+        return text_files
+
+    def read_file(self, file_path):
+        """
+        Read the content of a file.
+        """
+        return read_text_file(file_path)
+
+    def embed_batch(self, documents):
+        """
+        Embed a list of documents with a single call to the Ollama embed endpoint.
+        """
+        if not self.model:
+            return None
+
+        return get_embeddings(documents, self.model)
+
+    def add_to_batch(self, document_id, document, metadata):
+        """
+        Queue a document for embedding and upsert, flushing the batch once it is full.
+        """
+        self.pending_ids.append(document_id)
+        self.pending_documents.append(document)
+        self.pending_metadatas.append(metadata)
+
+        if len(self.pending_ids) >= self.batch_size:
+            self.flush_batch()
+
+    def flush_batch(self):
+        """
+        Embed and upsert all queued documents, one embedding call and one upsert for the whole batch.
+        """
+        if not self.pending_ids:
+            return
+
+        # ChromaDB rejects duplicate ids within a single upsert, keep the last occurrence like sequential upserts would
+        batch = {}
+        for document_id, document, metadata in zip(self.pending_ids, self.pending_documents, self.pending_metadatas):
+            batch.pop(document_id, None)
+            batch[document_id] = (document, metadata)
+
+        ids = list(batch.keys())
+        documents = [document for document, _ in batch.values()]
+        metadatas = [metadata for _, metadata in batch.values()]
+
+        self.pending_ids = []
+        self.pending_documents = []
+        self.pending_metadatas = []
+
+        if self.embedding_queue:
+            # Blocks when the embedding workers are busy, keeping memory usage bounded
+            self.embedding_queue.put((ids, documents, metadatas))
+            return
+
+        self.upsert_batch(ids, documents, metadatas, self.embed_batch(documents))
+
+    def upsert_batch(self, ids, documents, metadatas, embeddings):
+        """
+        Write a batch of documents to the collection with a single upsert, and to the keyword index.
+        """
+        if embeddings:
+            self.collection.upsert(
+                documents=documents,
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=embeddings
+            )
+        else:
+            self.collection.upsert(
+                documents=documents,
+                metadatas=metadatas,
+                ids=ids
+            )
+
+        if self.keyword_index:
+            self.keyword_index.upsert(ids, [metadata.get('tokens', document) for document, metadata in zip(documents, metadatas)])
+
+        self.mark_written(ids)
+
+    def track_file(self, file_path):
+        """
+        Start tracking the chunks of a file, register each chunk with track_chunk() before indexing it, then call finish_file() after the last one.
+        """
+        with self.written_lock:
+            self.unwritten_chunks[file_path] = set()
+            self.open_files.add(file_path)
+
+    def track_chunk(self, file_path, chunk_id):
+        with self.written_lock:
+            self.unwritten_chunks[file_path].add(chunk_id)
+            self.unwritten_chunk_files[chunk_id] = file_path
+
+    def finish_file(self, file_path):
+        """
+        Record that all the chunks of a file were produced, the file is added to written_files once all of them are written.
+        """
+        with self.written_lock:
+            self.open_files.discard(file_path)
+            if not self.unwritten_chunks[file_path]:
+                del self.unwritten_chunks[file_path]
+                self.written_files.append(file_path)
+
+    def mark_written(self, ids):
+        """
+        Record that chunks were written to the collection, called by the writer after every upsert.
+        """
+        with self.written_lock:
+            for chunk_id in ids:
+                file_path = self.unwritten_chunk_files.pop(chunk_id, None)
+                if file_path is None:
+                    continue
+
+                chunks = self.unwritten_chunks[file_path]
+                chunks.discard(chunk_id)
+                if not chunks and file_path not in self.open_files:
+                    del self.unwritten_chunks[file_path]
+                    self.written_files.append(file_path)
+
+    def delete_chunks(self, ids):
+        """
+        Remove chunks from the collection and from the keyword index, through the writer when the pipeline runs so that it is the only thread writing to the collection.
+        """
+        if self.write_queue:
+            self.write_queue.put((self.delete_batch, (ids,)))
+            return
+
+        self.delete_batch(ids)
+
+    def delete_batch(self, ids):
+        """
+        Delete a batch of chunks from the collection and from the keyword index. Deleted chunks tracked with track_chunk() count as written.
+        """
+        self.collection.delete(ids=ids)
+
+        if self.keyword_index:
+            self.keyword_index.delete(ids)
+
+        self.mark_written(ids)
+
+    def start_pipeline(self):
+        """
+        Start the embedding workers and the collection writer when indexing with several jobs.
+        """
+        if self.jobs <= 1:
+            return
+
+        self.pipeline_error = None
+        self.embedding_queue = queue.Queue(maxsize=self.jobs * 2)
+        self.write_queue = queue.Queue(maxsize=self.jobs * 2)
+
+        self.embedding_workers = [threading.Thread(target=self._embedding_worker, daemon=True) for _ in range(self.jobs)]
+        for worker in self.embedding_workers:
+            worker.start()
+
+        # A single writer keeps ChromaDB upserts sequential
+        self.writer = threading.Thread(target=self._write_worker, daemon=True)
+        self.writer.start()
+
+    def stop_pipeline(self):
+        """
+        Wait for all queued batches to be embedded and written, then raise the first error met by a worker.
+        """
+        if not self.embedding_queue:
+            return
+
+        for _ in self.embedding_workers:
+            self.embedding_queue.put(None)
+        for worker in self.embedding_workers:
+            worker.join()
+
+        self.write_queue.put(None)
+        self.writer.join()
+
+        self.embedding_queue = None
+        self.write_queue = None
+        self.embedding_workers = []
+        self.writer = None
+
+        if self.pipeline_error:
+            raise self.pipeline_error
+
+    def _embedding_worker(self):
+        while True:
+            batch = self.embedding_queue.get()
+            if batch is None:
+                break
+
+            # Keep consuming after an error so that producers never block
+            if self.pipeline_error:
+                continue
+
+            ids, documents, metadatas = batch
+            try:
+                self.write_queue.put((self.upsert_batch, (ids, documents, metadatas, self.embed_batch(documents))))
+            except Exception as e:
+                self.pipeline_error = e
+
+    def _write_worker(self):
+        while True:
+            batch = self.write_queue.get()
+            if batch is None:
+                break
+
+            if self.pipeline_error:
+                continue
+
+            write, arguments = batch
+            try:
+                write(*arguments)
+            except Exception as e:
+                self.pipeline_error = e
 
-    def get_text_files(self):
+    def chunk_files(self, files_to_chunk, allow_chunks, split_paragraphs):
         """
-        Recursively find all .txt and .md files in the root folder.
+        Read and chunk files, in a pool of worker processes when indexing with several jobs.
+
+        :param files_to_chunk: List of (file_path, previous_content_hash) tuples.
+        :return: A generator of chunk_file results, in the order of the input files.
         """
-        text_files = []
-        for root, dirs, files in os.walk(self.root_folder):
-            for file in files:
-                if file.endswith(".txt") or file.endswith(".md") or file.endswith(".tex"):
-                    text_files.append(os.path.join(root, file))
-        return text_files
+        if self.jobs <= 1:
+            for file_path, previous_content_hash in files_to_chunk:
+                if allow_chunks and os.path.getsize(file_path) > streaming_file_size:
+                    yield chunk_large_file(file_path, split_paragraphs, previous_content_hash, self.chunk_size)
+                else:
+                    yield chunk_file(file_path, allow_chunks, split_paragraphs, previous_content_hash, self.chunk_size)
+            return
 
-    def read_file(self, file_path):
+        with ProcessPoolExecutor(max_workers=self.jobs, mp_context=process_pool_context) as executor:
+            futures = deque()
+            for file_path, previous_content_hash in files_to_chunk:
+                if allow_chunks and os.path.getsize(file_path) > streaming_file_size:
+                    # Large files are streamed from the main process, straight into the embedding workers
+                    futures.append((file_path, previous_content_hash))
+                else:
+                    futures.append(executor.submit(chunk_file, file_path, allow_chunks, split_paragraphs, previous_content_hash, self.chunk_size))
+
+                # Limit the number of chunked files waiting for the embedding stage
+                if len(futures) >= self.jobs * 4:
+                    yield self._chunk_file_result(futures.popleft(), split_paragraphs)
+
+            while futures:
+                yield self._chunk_file_result(futures.popleft(), split_paragraphs)
+
+    def _chunk_file_result(self, future, split_paragraphs):
+        if isinstance(future, tuple):
+            file_path, previous_content_hash = future
+            return chunk_large_file(file_path, split_paragraphs, previous_content_hash, self.chunk_size)
+        return future.result()
+
+    def index_chunk(self, chunk_id, document, metadata):
         """
-        Read the content of a file.
+        Embed and upsert a single chunk, or queue it when batching is enabled.
         """
-        with open(file_path, 'r', encoding='utf-8') as file:
-            try:
-                return file.read()
-            except:
-                return None
+        # Tokenize once at index time, for keyword search and re-ranking
+        metadata = dict(metadata, tokens=" ".join(preprocess_text(document)))
+
+        if self.batch_size > 0:
+            self.add_to_batch(chunk_id, document, metadata)
+            return
+
+        # Embed the content
+        embedding = None
+        if self.model:
+            embedding = get_embedding(document, self.model)
+
+        # Upsert the chunk with additional metadata if available
+        self.upsert_batch([chunk_id], [document], [metadata], [embedding] if embedding else None)
 
     def index_documents(self, allow_chunks=True, no_chunking_confirmation=False, split_paragraphs=False, additional_metadata=None):
         """
@@ -973,97 +2885,505 @@ class DocumentIndexer:
             on_print("Large documents will be chunked into smaller pieces for indexing.")
             allow_chunks = on_user_input("Do you want to continue with chunking (if you answer 'no', large documents will be indexed as a whole)? [y/n]: ").lower() in ['y', 'yes']
 
-        if allow_chunks:
-            from langchain_text_splitters import RecursiveCharacterTextSplitter
-
         # Get the list of text files
         text_files = self.get_text_files()
 
-        if allow_chunks:
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        # Load the manifest of previously indexed files, to only process new or changed files
+        manifest = None
+        manifest_entries = {}
+        if self.incremental:
+            manifest = IndexManifest(self.collection_name, get_chroma_database_id(self.client))
+            if self.collection.count() == 0:
+                # The collection was emptied or deleted, everything has to be indexed again
+                manifest.clear()
+                if self.keyword_index:
+                    self.keyword_index.clear()
+            manifest_entries = manifest.get_entries(self.root_folder)
+
+        # Files indexed with different settings are considered changed
+        index_settings = json.dumps([allow_chunks, split_paragraphs, self.model, self.chunk_size])
 
         from tqdm import tqdm
         # Progress bar for indexing
         progress_bar = tqdm(total=len(text_files), desc="Indexing files", unit="file", bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}")
 
-        for file_path in text_files:
-            progress_bar.update(1)
+        start_time = time.perf_counter()
+        chunk_count = 0
+        skipped_files = 0
+        interrupted = False
 
-            try:
-                content = self.read_file(file_path)
+        # Files whose chunks are queued, waiting for their chunks to be written before updating the manifest
+        queued_files = {}
+        self.unwritten_chunks = {}
+        self.unwritten_chunk_files = {}
+        self.open_files = set()
+        self.written_files = deque()
+
+        def record_written_files():
+            while self.written_files:
+                written_file_path = self.written_files.popleft()
+                written_file_stat, content_hash, chunk_ids = queued_files.pop(written_file_path)
+                manifest.update(written_file_path, written_file_stat.st_size, written_file_stat.st_mtime, content_hash, index_settings, chunk_ids)
+
+        self.start_pipeline()
+
+        try:
+            # Skip files whose size and modification time did not change, without reading them
+            files_to_index = []
+            for file_path in text_files:
+                manifest_entry = manifest_entries.pop(os.path.abspath(file_path), None)
+                file_stat = None
+                if manifest:
+                    file_stat = os.stat(file_path)
+                    if manifest_entry and manifest_entry['size'] == file_stat.st_size and manifest_entry['mtime'] == file_stat.st_mtime and manifest_entry['settings'] == index_settings:
+                        skipped_files += 1
+                        progress_bar.update(1)
+                        continue
+
+                if manifest_entry and manifest_entry['settings'] != index_settings:
+                    previous_content_hash = None
+                else:
+                    previous_content_hash = manifest_entry['content_hash'] if manifest_entry else None
+
+                files_to_index.append((file_path, file_stat, manifest_entry, previous_content_hash))
+
+            chunked_files = self.chunk_files([(file_path, previous_content_hash) for file_path, _, _, previous_content_hash in files_to_index], allow_chunks, split_paragraphs)
+
+            for (file_path, file_stat, manifest_entry, _), chunked_file in zip(files_to_index, chunked_files):
+                progress_bar.update(1)
 
-                if not content:
+                if self.pipeline_error:
+                    break
+
+                if not chunked_file:
                     on_print(f"An error occurred while reading file: {file_path}", Fore.RED)
                     continue
 
-                document_id = os.path.splitext(os.path.basename(file_path))[0]
+                content_hash, chunks = chunked_file
+
+                if chunks is None:
+                    # Only the file timestamp changed
+                    if manifest:
+                        manifest.update(file_path, file_stat.st_size, file_stat.st_mtime, content_hash, index_settings, manifest_entry['chunk_ids'])
+                    skipped_files += 1
+                    continue
+
+                document_id = get_file_document_id(file_path)
                 
                 # Add any additional metadata for the file
                 file_metadata = {'filename': file_path}
                 if additional_metadata and file_path in additional_metadata:
                     file_metadata.update(additional_metadata[file_path])
 
+                if not allow_chunks:
+                    # Embed the whole document
+                    chunks = chunks[:1]
+
+                if manifest:
+                    self.track_file(file_path)
+
+                # Large files are chunked lazily, ids are built while the chunks are produced
+                chunk_ids = []
+                for i, chunk in enumerate(chunks):
+                    chunk_id = f"{document_id}_{i}" if allow_chunks else document_id
+                    chunk_ids.append(chunk_id)
+                    if manifest:
+                        self.track_chunk(file_path, chunk_id)
+                    self.index_chunk(chunk_id, chunk, file_metadata)
+
+                chunk_count += len(chunk_ids)
+
+                if manifest:
+                    # Remove the chunks left over from a previous, longer version of the file, the file is written once they are deleted
+                    new_chunk_ids = set(chunk_ids)
+                    stale_ids = [chunk_id for chunk_id in manifest_entry['chunk_ids'] if chunk_id not in new_chunk_ids] if manifest_entry else []
+                    if stale_ids:
+                        for chunk_id in stale_ids:
+                            self.track_chunk(file_path, chunk_id)
+                        self.delete_chunks(stale_ids)
+                    queued_files[file_path] = (file_stat, content_hash, chunk_ids)
+                    self.finish_file(file_path)
+                    record_written_files()
+        except KeyboardInterrupt:
+            interrupted = True
+        finally:
+            # Index the remaining chunks of the last batch and wait for the pipeline to drain
+            try:
+                self.flush_batch()
+                self.stop_pipeline()
+            finally:
+                # Files whose chunks were not all written are not recorded, they are indexed again next time
+                if manifest:
+                    record_written_files()
+                    manifest.commit()
+
+        progress_bar.close()
+
+        if manifest:
+            # Remaining manifest entries belong to files that were removed from the folder
+            removed_files = 0
+            if not interrupted:
+                for file_path, manifest_entry in manifest_entries.items():
+                    if manifest_entry['chunk_ids']:
+                        self.delete_chunks(manifest_entry['chunk_ids'])
+                    manifest.remove(file_path)
+                    removed_files += 1
+
+            manifest.commit()
+            on_print(f"Skipped {skipped_files} unchanged files, removed {removed_files} deleted files.", Fore.WHITE + Style.DIM)
+
+        elapsed_time = time.perf_counter() - start_time
+        if elapsed_time > 0:
+            on_print(f"Indexed {chunk_count} chunks in {elapsed_time:.1f} seconds ({chunk_count / elapsed_time:.1f} chunks/sec).", Fore.WHITE + Style.DIM)
+
+        if verbose_mode and embedding_cache:
+            on_print(embedding_cache.get_stats(), Fore.WHITE + Style.DIM)
+
+    def index_records(self, records, allow_chunks=True, split_paragraphs=False, skip_unchanged=False, deadline=None):
+        """
+        Index texts held in memory, without any file system access.
+
+        :param records: An iterable of (document_id, text, metadata) tuples, chunk ids are built from the document id.
+        :param allow_chunks: Whether to chunk the texts, otherwise each text is indexed as a single chunk.
+        :param split_paragraphs: Whether to split markdown content into paragraphs.
+        :param skip_unchanged: Whether to skip documents already indexed with the same content and settings, the content hash being stored in the chunk metadata.
+        :param deadline: Optional time.monotonic() value after which no more documents are indexed, their ids are listed in skipped_document_ids.
+        :return: The number of indexed chunks.
+        """
+        records = list(records)
+        self.skipped_document_ids = []
+        start_time = time.perf_counter()
+        chunk_count = 0
+        # Number of chunks of each indexed or unchanged document
+        self.document_chunk_counts = {}
+        skipped_records = 0
+        index_settings = json.dumps([allow_chunks, split_paragraphs, self.model, self.chunk_size])
+
+        # The first chunk of each indexed document holds its content hash and chunk count
+        indexed_documents = {}
+        if skip_unchanged and records:
+            first_chunk_ids = list({f"{document_id}_0" if allow_chunks else document_id for document_id, _, _ in records})
+            existing_chunks = self.collection.get(ids=first_chunk_ids, include=["metadatas"])
+            for chunk_id, metadata in zip(existing_chunks["ids"], existing_chunks["metadatas"]):
+                indexed_documents[chunk_id] = metadata or {}
+
+        self.start_pipeline()
+
+        try:
+            seen_document_ids = set()
+            for document_id, text, metadata in records:
+                if self.pipeline_error:
+                    break
+
+                if not text or document_id in seen_document_ids:
+                    continue
+
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.skipped_document_ids.append(document_id)
+                    continue
+                seen_document_ids.add(document_id)
+
+                metadata = dict(metadata or {})
+                indexed_metadata = None
+                if skip_unchanged:
+                    content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+                    indexed_metadata = indexed_documents.get(f"{document_id}_0" if allow_chunks else document_id)
+                    if indexed_metadata and indexed_metadata.get('content_hash') == content_hash and indexed_metadata.get('index_settings') == index_settings:
+                        self.document_chunk_counts[document_id] = indexed_metadata.get('chunk_count', 1)
+                        skipped_records += 1
+                        continue
+                    metadata.update({'content_hash': content_hash, 'index_settings': index_settings})
+
                 if allow_chunks:
-                    chunks = []
-                    # Split Markdown files into sections if needed
-                    if is_markdown(file_path):
-                        markdown_splitter = MarkdownSplitter(content, split_paragraphs=split_paragraphs)
-                        chunks = markdown_splitter.split()
-                    else:
-                        chunks = text_splitter.split_text(content)
-                    
+                    chunks = chunk_text(text, split_paragraphs=split_paragraphs, chunk_size=self.chunk_size, markdown=is_markdown_text(text))
+                    metadata['chunk_count'] = len(chunks)
+                    self.document_chunk_counts[document_id] = len(chunks)
                     for i, chunk in enumerate(chunks):
-                        chunk_id = f"{document_id}_{i}"
-                        
-                        # Embed the content
-                        embedding = None
-                        if self.model:
-                            response = ollama.embeddings(
-                                prompt=chunk,
-                                model=self.model
-                            )
-                            embedding = response["embedding"]
-                        
-                        # Upsert the chunk with additional metadata if available
-                        if embedding:
-                            self.collection.upsert(
-                                documents=[chunk],
-                                metadatas=[file_metadata],
-                                ids=[chunk_id],
-                                embeddings=[embedding]
-                            )
-                        else:
-                            self.collection.upsert(
-                                documents=[chunk],
-                                metadatas=[file_metadata],
-                                ids=[chunk_id]
-                            )
+                        self.index_chunk(f"{document_id}_{i}", chunk, metadata)
+                    chunk_count += len(chunks)
+
+                    # Remove the chunks left over from a previous, longer version of the document
+                    previous_chunk_count = (indexed_metadata or {}).get('chunk_count', 0)
+                    if previous_chunk_count > len(chunks):
+                        self.delete_chunks([f"{document_id}_{i}" for i in range(len(chunks), previous_chunk_count)])
                 else:
-                    # Embed the whole document
-                    embedding = None
-                    if self.model:
-                        response = ollama.embeddings(
-                            prompt=content,
-                            model=self.model
-                        )
-                        embedding = response["embedding"]
-
-                    # Upsert the document with additional metadata if available
-                    if embedding:
-                        self.collection.upsert(
-                            documents=[content],
-                            metadatas=[file_metadata],
-                            ids=[document_id],
-                            embeddings=[embedding]
-                        )
-                    else:
-                        self.collection.upsert(
-                            documents=[content],
-                            metadatas=[file_metadata],
-                            ids=[document_id]
-                        )
-            except KeyboardInterrupt:
+                    self.index_chunk(document_id, text, metadata)
+                    self.document_chunk_counts[document_id] = 1
+                    chunk_count += 1
+        finally:
+            # Index the remaining chunks of the last batch and wait for the pipeline to drain
+            self.flush_batch()
+            self.stop_pipeline()
+
+        if verbose_mode and skip_unchanged:
+            on_print(f"Skipped {skipped_records} unchanged documents, indexed {len(seen_document_ids) - skipped_records} new or changed documents.", Fore.WHITE + Style.DIM)
+
+        elapsed_time = time.perf_counter() - start_time
+        if verbose_mode and elapsed_time > 0:
+            on_print(f"Indexed {chunk_count} chunks in {elapsed_time:.1f} seconds ({chunk_count / elapsed_time:.1f} chunks/sec).", Fore.WHITE + Style.DIM)
+
+        return chunk_count
+
+class WebCacheTracker:
+    def __init__(self, tracker_file="web_cache.db"):
+        """
+        Keep track of the documents of the web cache collections (chunk count, size, indexing and last hit times), stored in a SQLite database, to evict stale and least recently used pages.
+
+        :param tracker_file: The name of the SQLite file, created in the user data directory.
+        """
+        dirs = AppDirs(APP_NAME, APP_AUTHOR, version=APP_VERSION)
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+
+        self.tracker_file = os.path.join(dirs.user_data_dir, tracker_file)
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.tracker_file, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS documents (collection TEXT NOT NULL, document_id TEXT NOT NULL, url TEXT, chunk_count INTEGER NOT NULL, size INTEGER NOT NULL, indexed_at REAL NOT NULL, last_hit REAL NOT NULL, PRIMARY KEY (collection, document_id))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS documents_last_hit ON documents (collection, last_hit)")
+        self.connection.commit()
+
+    def touch(self, collection_name, document_id, url, chunk_count, size):
+        """
+        Record that a document was crawled and indexed (or found unchanged) now.
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute("INSERT INTO documents (collection, document_id, url, chunk_count, size, indexed_at, last_hit) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (collection, document_id) DO UPDATE SET url = excluded.url, chunk_count = excluded.chunk_count, size = excluded.size, indexed_at = excluded.indexed_at, last_hit = excluded.last_hit", (collection_name, document_id, url, chunk_count, size, now, now))
+            self.connection.commit()
+
+    def record_hits(self, collection_name, document_ids):
+        """
+        Record that chunks of these documents were returned by a query.
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.executemany("UPDATE documents SET last_hit = ? WHERE collection = ? AND document_id = ?", [(now, collection_name, document_id) for document_id in set(document_ids)])
+            self.connection.commit()
+
+    def select_evictions(self, collection_name, max_age=None, max_chunks=None, max_size=None):
+        """
+        Select the documents to evict: documents indexed more than max_age seconds ago, then the least recently hit documents until the collection fits in max_chunks and max_size bytes.
+
+        :return: A list of (document_id, chunk_count, size, reason) tuples, reason being "age", "chunks" or "size".
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT document_id, chunk_count, size, indexed_at FROM documents WHERE collection = ? ORDER BY last_hit", (collection_name,)).fetchall()
+
+        evictions = []
+        kept = []
+        expiration_time = time.time() - max_age if max_age else None
+        for document_id, chunk_count, size, indexed_at in rows:
+            if expiration_time is not None and indexed_at < expiration_time:
+                evictions.append((document_id, chunk_count, size, "age"))
+            else:
+                kept.append((document_id, chunk_count, size))
+
+        total_chunks = sum(chunk_count for _, chunk_count, _ in kept)
+        total_size = sum(size for _, _, size in kept)
+        for document_id, chunk_count, size in kept:
+            over_chunks = max_chunks and total_chunks > max_chunks
+            over_size = max_size and total_size > max_size
+            if not over_chunks and not over_size:
+                break
+            evictions.append((document_id, chunk_count, size, "chunks" if over_chunks else "size"))
+            total_chunks -= chunk_count
+            total_size -= size
+
+        return evictions
+
+    def remove(self, collection_name, document_ids):
+        with self.lock:
+            self.connection.executemany("DELETE FROM documents WHERE collection = ? AND document_id = ?", [(collection_name, document_id) for document_id in document_ids])
+            self.connection.commit()
+
+    def clear(self, collection_name):
+        with self.lock:
+            self.connection.execute("DELETE FROM documents WHERE collection = ?", (collection_name,))
+            self.connection.commit()
+
+    def get_totals(self, collection_name):
+        """
+        :return: A tuple (documents, chunks, size) for the tracked documents of a collection.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*), COALESCE(SUM(chunk_count), 0), COALESCE(SUM(size), 0) FROM documents WHERE collection = ?", (collection_name,)).fetchone()
+
+def get_web_cache_tracker():
+    global web_cache_tracker
+
+    if web_cache_tracker is None:
+        web_cache_tracker = WebCacheTracker()
+    return web_cache_tracker
+
+def prune_web_cache(collection_name=None, verbose=True):
+    """
+    Evict the pages of a web cache collection older than --web-cache-max-age, then the least recently hit pages until the collection fits in --web-cache-max-chunks and --web-cache-max-size.
+
+    :return: A dictionary of eviction statistics.
+    """
+    collection_name = collection_name or web_cache_collection_name
+    tracker = get_web_cache_tracker()
+    start_time = time.perf_counter()
+
+    evictions = tracker.select_evictions(collection_name, max_age=web_cache_max_age_days * 24 * 3600 if web_cache_max_age_days > 0 else None, max_chunks=web_cache_max_chunks if web_cache_max_chunks > 0 else None, max_size=web_cache_max_size * 1024 * 1024 if web_cache_max_size > 0 else None)
+
+    stats = {"age": 0, "chunks": 0, "size": 0, "evicted_chunks": 0, "evicted_bytes": 0}
+    if evictions:
+        chunk_ids = [f"{document_id}_{i}" for document_id, chunk_count, _, _ in evictions for i in range(chunk_count)]
+        try:
+            web_collection = chroma_client.get_collection(name=collection_name)
+            for start in range(0, len(chunk_ids), 1000):
+                web_collection.delete(ids=chunk_ids[start:start + 1000])
+        except Exception as e:
+            on_print(f"Error pruning the web cache: {e}", Fore.RED)
+            return None
+
+        keyword_index = get_keyword_index(collection_name)
+        if keyword_index:
+            keyword_index.delete(chunk_ids)
+
+        tracker.remove(collection_name, [document_id for document_id, _, _, _ in evictions])
+
+        for _, chunk_count, size, reason in evictions:
+            stats[reason] += 1
+            stats["evicted_chunks"] += chunk_count
+            stats["evicted_bytes"] += size
+
+    documents, chunks, size = tracker.get_totals(collection_name)
+    stats.update({"documents": documents, "remaining_chunks": chunks, "remaining_bytes": size, "elapsed_time": time.perf_counter() - start_time})
+
+    if verbose:
+        on_print(f"Web cache pruned: {len(evictions)} pages evicted ({stats['age']} expired, {stats['chunks']} over the chunk limit, {stats['size']} over the size limit), {stats['evicted_chunks']} chunks and {stats['evicted_bytes'] / (1024 * 1024):.1f} MB freed. {documents} pages, {chunks} chunks and {size / (1024 * 1024):.1f} MB left, in {stats['elapsed_time']:.2f} seconds.", Fore.WHITE + Style.DIM)
+
+    return stats
+
+def schedule_web_cache_compaction(collection_name=None):
+    """
+    Prune the web cache in a background thread, at most once per --web-cache-compaction-interval.
+    """
+    global web_cache_compaction_thread
+    global web_cache_last_compaction
+
+    if web_cache_compaction_interval < 0 or time.time() - web_cache_last_compaction < web_cache_compaction_interval:
+        return
+    if web_cache_compaction_thread and web_cache_compaction_thread.is_alive():
+        return
+
+    web_cache_last_compaction = time.time()
+    web_cache_compaction_thread = threading.Thread(target=prune_web_cache, args=(collection_name, verbose_mode), daemon=True)
+    web_cache_compaction_thread.start()
+
+class WebSearchCache:
+    def __init__(self, cache_file="web_search_cache.db", ttl=24 * 3600):
+        """
+        Initialize a persistent cache of web search results stored in a SQLite database.
+
+        :param cache_file: The name of the SQLite file, created in the user data directory.
+        :param ttl: Number of seconds during which cached results are used.
+        """
+        dirs = AppDirs(APP_NAME, APP_AUTHOR, version=APP_VERSION)
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+
+        self.cache_file = os.path.join(dirs.user_data_dir, cache_file)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS search_results (query_key TEXT NOT NULL, max_results INTEGER NOT NULL, results TEXT NOT NULL, stored REAL NOT NULL, PRIMARY KEY (query_key, max_results))")
+        self.connection.commit()
+
+    @staticmethod
+    def get_query_key(query):
+        """
+        Normalize a query so that spellings differing only by case or whitespace share the same results.
+        Words, their order and operators such as "not" or "-" change the results of the search engine, they are kept.
+        """
+        return " ".join(query.lower().split())
+
+    def get(self, query, max_results):
+        with self.lock:
+            row = self.connection.execute("SELECT results FROM search_results WHERE query_key = ? AND max_results = ? AND stored > ?", (self.get_query_key(query), max_results, time.time() - self.ttl)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, query, max_results, results):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO search_results (query_key, max_results, results, stored) VALUES (?, ?, ?, ?)", (self.get_query_key(query), max_results, json.dumps(results), time.time()))
+            # Expired results are never used again
+            self.connection.execute("DELETE FROM search_results WHERE stored <= ?", (time.time() - self.ttl,))
+            self.connection.commit()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups > 0 else 0
+        return f"Web search cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate)."
+
+def get_web_search_client():
+    """
+    Return the search client shared by all web searches.
+    """
+    global web_search_client
+
+    if web_search_client is None:
+        web_search_client = DDGS(timeout=max(1, int(web_timeout)) if web_timeout > 0 else 10)
+    return web_search_client
+
+def search_web(query, n_results=5, deadline=None):
+    """
+    Search the web, using cached results for the same query when available, and retrying with exponential backoff and jitter when rate limited.
+
+    :param deadline: Optional time.monotonic() value after which no more retries are attempted.
+    :return: The list of search results, each a dict with at least an 'href' key.
+    """
+    if web_search_cache:
+        search_results = web_search_cache.get(query, n_results)
+        if search_results is not None:
+            if verbose_mode:
+                on_print("Web search results found in cache.", Fore.WHITE + Style.DIM)
+            return search_results
+
+    search_results = None
+    for attempt in range(web_search_retries + 1):
+        try:
+            search_results = get_web_search_client().text(query, max_results=n_results) or []
+            break
+        except RatelimitException as e:
+            delay = min(30, 2 ** attempt) * random.uniform(0.5, 1.5)
+            if attempt == web_search_retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                on_print(f"Web search rate limited, no results: {e}", Fore.RED)
                 break
+            if verbose_mode:
+                on_print(f"Web search rate limited, retrying in {delay:.1f} seconds.", Fore.WHITE + Style.DIM)
+            time.sleep(delay)
+        except Exception as e:
+            on_print(f"Web search failed: {e}", Fore.RED)
+            break
+
+    if search_results and web_search_cache:
+        web_search_cache.put(query, n_results, search_results)
+
+    return search_results or []
+
+def normalize_url(url):
+    """
+    Normalize a URL so that the different spellings of a page share the same web cache entry:
+    lowercase scheme and host, no default port, no fragment, no trailing slash, sorted query parameters without tracking parameters.
+    """
+    parsed_url = urlparse(url.strip())
+    scheme = parsed_url.scheme.lower()
+    host = (parsed_url.hostname or "").lower()
+    if parsed_url.port and not (scheme == "http" and parsed_url.port == 80) and not (scheme == "https" and parsed_url.port == 443):
+        host += f":{parsed_url.port}"
+
+    path = parsed_url.path.rstrip("/") or "/"
+    query_parameters = sorted((key, value) for key, value in parse_qsl(parsed_url.query, keep_blank_values=True) if not key.lower().startswith("utm_") and key.lower() not in ("fbclid", "gclid"))
+
+    return urlunparse((scheme, host, path, "", urlencode(query_parameters), ""))
 
 def web_search(query=None, n_results=5, web_cache_collection=web_cache_collection_name, web_embedding_model="nomic-embed-text", num_ctx=None):
     global current_model
@@ -1073,49 +3393,47 @@ def web_search(query=None, n_results=5, web_cache_collection=web_cache_collectio
     if not query:
         return ""
 
-    search = DDGS()
+    # Time budget shared by the search, the crawl and the indexing, the last quarter being kept to index the crawled pages
+    deadline = time.monotonic() + web_timeout if web_timeout > 0 else None
+    crawl_deadline = deadline - web_timeout / 4 if deadline else None
+
     urls = []
     # Add the search results to the chatbot response
-    try:
-        search_results = search.text(query, max_results=n_results)
-        if search_results:
-            for i, search_result in enumerate(search_results):
-                urls.append(search_result['href'])
-    except:
-        # TODO: handle retries in case of duckduckgo_search.exceptions.RatelimitException
-        pass
+    for search_result in search_web(query, n_results, deadline=deadline):
+        if search_result.get('href'):
+            urls.append(search_result['href'])
 
     if verbose_mode:
         on_print("Web Search Results:", Fore.WHITE + Style.DIM)
         on_print(urls, Fore.WHITE + Style.DIM)
 
-    webCrawler = SimpleWebCrawler(urls, llm_enabled=True, system_prompt="You are a web crawler assistant.", selected_model=current_model, temperature=0.1, verbose=verbose_mode, plugins=plugins, num_ctx=num_ctx)
+    webCrawler = SimpleWebCrawler(urls, llm_enabled=True, system_prompt="You are a web crawler assistant.", selected_model=current_model, temperature=0.1, verbose=verbose_mode, plugins=plugins, num_ctx=num_ctx, max_workers=web_crawl_jobs, max_workers_per_host=web_crawl_jobs_per_host, deadline=crawl_deadline)
     # webCrawler.crawl(task=f"Highlight key-points about '{query}', using information provided. Format output as a list of bullet points.")
     webCrawler.crawl()
     articles = webCrawler.get_articles()
 
-    # Save articles to temporary files, before indexing them in the vector database
-    # Create a random folder to store the temporary files, in the OS temp directory
-    temp_folder = tempfile.mkdtemp()
-    additional_metadata = {}
-    for i, article in enumerate(articles):
-        # Compute the file path for the article, using the url as the filename, removing invalid characters
-        temp_file_name = re.sub(r'[<>:"/\\|?*]', '', article['url'])
-
-        temp_file_path = os.path.join(temp_folder, f"{temp_file_name}_{i}.txt")
-        with open(temp_file_path, 'w', encoding='utf-8') as f:
-            f.write(article['text'])
-            additional_metadata[temp_file_path] = {'url': article['url']}
-
-    # Index the articles in the vector database
-    document_indexer = DocumentIndexer(temp_folder, web_cache_collection, chroma_client, web_embedding_model)
-    document_indexer.index_documents(no_chunking_confirmation=True, additional_metadata=additional_metadata)
-
-    # Remove the temporary folder and its contents
-    for file in os.listdir(temp_folder):
-        file_path = os.path.join(temp_folder, file)
-        os.remove(file_path)
-    os.rmdir(temp_folder)
+    # Index the articles in the vector database, straight from memory
+    # Pages are identified by their normalized URL, unchanged pages are neither chunked nor embedded again
+    records = []
+    for article in articles:
+        document_id = "web_" + hashlib.sha1(normalize_url(article['url']).encode('utf-8')).hexdigest()
+        records.append((document_id, article['text'], {'url': article['url']}))
+
+    document_indexer = DocumentIndexer(None, web_cache_collection, chroma_client, web_embedding_model, batch_size=index_batch_size)
+    document_indexer.index_records(records, skip_unchanged=True, deadline=deadline)
+
+    if verbose_mode:
+        skipped_urls = webCrawler.skipped_urls + [metadata['url'] for document_id, _, metadata in records if document_id in document_indexer.skipped_document_ids]
+        if skipped_urls:
+            on_print(f"Web search time budget of {web_timeout:g} seconds exceeded, skipped {len(skipped_urls)} URLs:", Fore.WHITE + Style.DIM)
+            on_print(skipped_urls, Fore.WHITE + Style.DIM)
+
+    # Crawled pages are fresh again, whether they changed or not
+    tracker = get_web_cache_tracker()
+    for document_id, text, metadata in records:
+        if document_id in document_indexer.document_chunk_counts:
+            tracker.touch(web_cache_collection, document_id, metadata['url'], document_indexer.document_chunk_counts[document_id], len(text.encode('utf-8')))
+    schedule_web_cache_compaction(web_cache_collection)
 
     # Search the vector database for the query
     return query_vector_database(query, collection_name=web_cache_collection, n_results=10, query_embeddings_model=web_embedding_model)
@@ -1150,6 +3468,8 @@ def print_possible_prompt_commands():
     /chatbot: Change the chatbot personality.
     /collection: Change the vector database collection.
     /rmcollection <collection name>: Delete the vector database collection.
+    /cache prune: Evict expired and least recently used pages from the web cache.
+    /context: Show the number of tokens used by the system prompt, the summary of earlier turns and the recent turns of the conversation.
     /context <model context size>: Change the model's context window size. Default value: 2. Size must be a numeric value between 2 and 125.
     /index <folder path>: Index text files in the folder to the vector database.
     /cb: Replace /cb with the clipboard content.
@@ -1283,6 +3603,7 @@ def set_current_collection(collection_name):
     try:
         collection = chroma_client.get_or_create_collection(name=collection_name)
         on_print(f"Collection {collection_name} loaded.", Fore.WHITE + Style.DIM)
+        check_collection_embeddings(collection, embeddings_model)
         current_collection_name = collection_name
     except:
         raise Exception(f"Collection {collection_name} not found")
@@ -1304,34 +3625,112 @@ def delete_collection(collection_name):
 
     try:
         chroma_client.delete_collection(name=collection_name)
+        IndexManifest(collection_name, get_chroma_database_id(chroma_client)).clear()
+        keyword_index = get_keyword_index(collection_name)
+        if keyword_index:
+            keyword_index.clear()
+        get_web_cache_tracker().clear(collection_name)
         on_print(f"Collection {collection_name} deleted.", Fore.WHITE + Style.DIM)
     except:
         on_print(f"Collection {collection_name} not found.", Fore.RED)
 
 def preprocess_text(text):
-    global stop_words
-
     # If text is empty, return empty list
     if not text or len(text) == 0:
         return []
 
     # Convert text to lowercase
     text = text.lower()
-    # Replace punctuation with spaces, excepting dots
-    text = re.sub(r'[^\w\s.,]', ' ', text)
+    # Join the parts of identifiers, which would be split by the punctuation replacement
+    if '-' in text or '/' in text or ':' in text:
+        text = identifier_pattern.sub(lambda match: identifier_separator_pattern.sub('_', match.group()), text)
+    # Replace punctuation with spaces, excepting dots and commas
+    if text.isascii():
+        text = text.translate(ascii_punctuation_table)
+    else:
+        text = punctuation_pattern.sub(' ', text)
     # Replace '. ' and ', ' with space
-    text = re.sub(r'\. |, ', ' ', text)
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text)
-    # Tokenize the text
+    text = separator_pattern.sub(' ', text)
+    # Tokenize the text, splitting on any whitespace
     words = text.split()
     # Remove dot from the end of words
     words = [word[:-1] if word.endswith('.') else word for word in words]
-    # Remove stop words
-    words = [word for word in words if word not in stop_words]
+    # Remove stop words and empty words
+    words = [word for word in words if word and word not in stop_words]
 
     return words
 
+def get_document_tokens(document, metadata):
+    """
+    Return the tokens of an indexed chunk, using the tokens stored in its metadata at index time when available.
+    """
+    if metadata and 'tokens' in metadata:
+        return metadata['tokens'].split()
+    return preprocess_text(document)
+
+def expand_question(question, question_context=None, model=None):
+    """
+    Ask the model to write a short passage elaborating on a question, to improve retrieval.
+
+    :return: The expansion, or an empty string if the model did not answer.
+    """
+    system_prompt = "You are an assistant that helps expand and clarify user questions to improve information retrieval. When a user provides a question, your task is to write a short passage that elaborates on the query by adding relevant background information, inferred details, and related concepts that can help with retrieval. The passage should remain concise and focused, without changing the original meaning of the question.\r\nGuidelines:\r\n1. Expand the question briefly by including additional context or background, staying relevant to the user's original intent.\r\n2. Incorporate inferred details or related concepts that help clarify or broaden the query in a way that aids retrieval.\r\n3. Keep the passage short, usually no more than 2-3 sentences, while maintaining clarity and depth.\r\n4. Avoid introducing unrelated or overly specific topics. Keep the expansion concise and to the point."
+    if question_context:
+        system_prompt += f"\n\nAdditional context about the user query:\n{question_context}"
+
+    # Expansions are cached by query_vector_database in the query expansion cache, not in the LLM response cache
+    return ask_ollama(system_prompt, question, selected_model=model, no_bot_prompt=True, stream_active=False) or ""
+
+def search_collection(question, query_embeddings_model=None, n_results=25):
+    """
+    Run a vector search for a question on the current collection.
+    """
+    if query_embeddings_model is None:
+        return collection.query(
+            query_texts=[question],
+            n_results=n_results
+        )
+
+    # generate an embedding for the question and retrieve the most relevant doc
+    query_embedding = get_embedding(question, query_embeddings_model)
+    return collection.query(
+        query_embeddings=[query_embedding],
+        n_results=n_results
+    )
+
+def merge_query_results(results):
+    """
+    Merge the results of several vector searches, keeping the smallest distance of each chunk and ordering chunks by distance.
+    """
+    if len(results) == 1:
+        return results[0]
+
+    merged = {}
+    for result in results:
+        if not result["ids"]:
+            continue
+        for chunk_id, document, distance, metadata in zip(result["ids"][0], result["documents"][0], result["distances"][0], result["metadatas"][0]):
+            if chunk_id not in merged or distance < merged[chunk_id][1]:
+                merged[chunk_id] = (document, distance, metadata)
+
+    ranked = sorted(merged.items(), key=lambda item: item[1][1])
+    return {
+        "ids": [[chunk_id for chunk_id, _ in ranked]],
+        "documents": [[document for _, (document, _, _) in ranked]],
+        "distances": [[distance for _, (_, distance, _) in ranked]],
+        "metadatas": [[metadata for _, (_, _, metadata) in ranked]]
+    }
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Merge several rankings of ids into one, scoring each id by the sum of 1 / (k + rank) over the rankings.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] = scores.get(item_id, 0) + 1 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
 def query_vector_database(question, collection_name=current_collection_name, n_results=number_of_documents_to_return_from_vector_db, answer_distance_threshold=0, query_embeddings_model=None, expand_query=True, question_context=None):
     global collection
     global verbose_mode
@@ -1383,34 +3782,32 @@ def query_vector_database(question, collection_name=current_collection_name, n_r
     if collection_name and collection_name != current_collection_name:
         set_current_collection(collection_name)
 
+    expansion = None
+    results = []
     if expand_query:
-        # Expand the query for better retrieval
-        system_prompt = "You are an assistant that helps expand and clarify user questions to improve information retrieval. When a user provides a question, your task is to write a short passage that elaborates on the query by adding relevant background information, inferred details, and related concepts that can help with retrieval. The passage should remain concise and focused, without changing the original meaning of the question.\r\nGuidelines:\r\n1. Expand the question briefly by including additional context or background, staying relevant to the user's original intent.\r\n2. Incorporate inferred details or related concepts that help clarify or broaden the query in a way that aids retrieval.\r\n3. Keep the passage short, usually no more than 2-3 sentences, while maintaining clarity and depth.\r\n4. Avoid introducing unrelated or overly specific topics. Keep the expansion concise and to the point."
-        if question_context:
-            system_prompt += f"\n\nAdditional context about the user query:\n{question_context}"
-
-        response = ask_ollama(system_prompt, question, selected_model=current_model, no_bot_prompt=True, stream_active=False)
-        if response:
-            question += "\n" + response
-            if verbose_mode:
-                on_print("Expanded query:", Fore.WHITE + Style.DIM)
-                on_print(question, Fore.WHITE + Style.DIM)
-    
-    if query_embeddings_model is None:
-        result = collection.query(
-            query_texts=[question],
-            n_results=25
-        )
-    else:
-        # generate an embedding for the question and retrieve the most relevant doc
-        response = ollama.embeddings(
-            prompt=question,
-            model=query_embeddings_model
-        )
-        result = collection.query(
-            query_embeddings=[response["embedding"]],
-            n_results=25
-        )
+        if query_expansion_cache:
+            expansion = query_expansion_cache.get(current_model, question, question_context)
+
+        if expansion is None:
+            # Search with the raw question while the expansion is being generated, then merge both candidate sets
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                expansion_future = executor.submit(expand_question, question, question_context, current_model)
+                results.append(search_collection(question, query_embeddings_model))
+                expansion = expansion_future.result()
+
+            if expansion and query_expansion_cache:
+                query_expansion_cache.put(current_model, question, question_context, expansion)
+
+    if expansion:
+        question += "\n" + expansion
+        if verbose_mode:
+            on_print("Expanded query:", Fore.WHITE + Style.DIM)
+            on_print(question, Fore.WHITE + Style.DIM)
+
+    if expansion or not results:
+        results.append(search_collection(question, query_embeddings_model))
+
+    result = merge_query_results(results)
 
     documents = result["documents"][0]
     distances = result["distances"][0]
@@ -1423,26 +3820,52 @@ def query_vector_database(question, collection_name=current_collection_name, n_r
 
     metadatas = result["metadatas"][0]
 
-    # Preprocess and re-rank using BM25
     preprocessed_query = preprocess_text(question)
-    preprocessed_docs = [preprocess_text(doc) for doc in documents]
+
+    # Preprocess and re-rank using BM25
+    preprocessed_docs = [get_document_tokens(doc, metadata) for doc, metadata in zip(documents, metadatas)]
 
     # Apply BM25 re-ranking
     bm25 = BM25Okapi(preprocessed_docs)
     bm25_scores = bm25.get_scores(preprocessed_query)
 
-    # Get top rerank_n documents based on BM25 score
+    # Sort the vector search candidates by BM25 score
     reranked_results = sorted(
-        enumerate(zip(metadatas, distances, documents, bm25_scores)),
+        zip(result["ids"][0], zip(metadatas, distances, documents, bm25_scores)),
         key=lambda x: x[1][3],  # Sort by BM25 score
         reverse=True
-    )[:n_results]
+    )
+
+    keyword_index = get_keyword_index(current_collection_name)
+    if keyword_index and not keyword_index.is_empty():
+        # Fuse the re-ranked candidates with a BM25 search over the whole collection, to find the chunks missed by the vector search
+        reranked_ids = [chunk_id for chunk_id, _ in reranked_results]
+        keyword_ids = keyword_index.search(preprocessed_query, n_results=25)
+
+        if verbose_mode:
+            on_print(f"Keyword search results: {len(keyword_ids)}, not found by vector search: {len(set(keyword_ids) - set(reranked_ids))}", Fore.WHITE + Style.DIM)
+
+        fused_ids = reciprocal_rank_fusion([reranked_ids, keyword_ids])[:n_results]
+
+        # Fetch the chunks only found by the keyword search
+        results_by_id = dict(reranked_results)
+        missing_ids = [chunk_id for chunk_id in fused_ids if chunk_id not in results_by_id]
+        if missing_ids:
+            missing_results = collection.get(ids=missing_ids, include=["documents", "metadatas"])
+            for chunk_id, metadata, document in zip(missing_results["ids"], missing_results["metadatas"], missing_results["documents"]):
+                results_by_id[chunk_id] = (metadata or {}, None, document, None)
+
+        reranked_results = [(chunk_id, results_by_id[chunk_id]) for chunk_id in fused_ids if chunk_id in results_by_id]
+
+    reranked_results = reranked_results[:n_results]
 
     # Join all possible answers into one string
     answers = []
     answer_index = 0
-    for idx, (metadata, distance, document, bm25_score) in reranked_results:
-        if answer_distance_threshold > 0 and distance > answer_distance_threshold:
+    answer_ids = []
+    for chunk_id, (metadata, distance, document, bm25_score) in reranked_results:
+        # Chunks only found by the keyword search have no distance
+        if answer_distance_threshold > 0 and distance is not None and distance > answer_distance_threshold:
             if verbose_mode:
                 on_print("Skipping answer with distance: " + str(distance), Fore.WHITE + Style.DIM)
             continue
@@ -1466,6 +3889,11 @@ def query_vector_database(question, collection_name=current_collection_name, n_r
             formatted_answer += "\nFile Path: " + filePath
 
         answers.append(formatted_answer.strip())
+        answer_ids.append(chunk_id)
+
+    if current_collection_name == web_cache_collection_name and answer_ids:
+        # Pages returned by a query are kept longer by the web cache eviction
+        get_web_cache_tracker().record_hits(current_collection_name, [chunk_id.rsplit('_', 1)[0] for chunk_id in answer_ids])
 
     return '\n\n'.join(answers)
 
@@ -1755,8 +4183,9 @@ def ask_ollama_with_conversation(conversation, model, temperature=0.1, prompt_te
     if num_ctx:
         ollama_options["num_ctx"] = num_ctx
 
+    start_time = time.perf_counter()
     try:
-        stream = ollama.chat(
+        stream = get_ollama_clients().chat(
             model=model,
             messages=conversation,
             # If tools are selected, deactivate the stream to get the full response (Ollama API limitation)
@@ -1784,8 +4213,10 @@ def ask_ollama_with_conversation(conversation, model, temperature=0.1, prompt_te
                 if alternate_model:
                     on_print(f"Response from model: {model}\n")
                 chunk_count = 0
+                first_token_time = None
+                last_chunk = None
                 for chunk in stream:
-                    continue_response_generation = True
+                    continue_response_generation = not generation_stop_requested()
                     for plugin in plugins:
                         if hasattr(plugin, "stop_generation") and callable(getattr(plugin, "stop_generation")):
                             plugin_response = getattr(plugin, "stop_generation")()
@@ -1798,6 +4229,9 @@ def ask_ollama_with_conversation(conversation, model, temperature=0.1, prompt_te
                         break
 
                     chunk_count += 1
+                    last_chunk = chunk
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter() - start_time
 
                     delta = chunk['message'].get('content', '')
 
@@ -1810,13 +4244,18 @@ def ask_ollama_with_conversation(conversation, model, temperature=0.1, prompt_te
                     bot_response += delta
                     
                     if syntax_highlighting and interactive_mode:
-                        print_spinning_wheel(chunk_count)
+                        # The spinner of concurrent generations is shown by generate_responses_concurrently()
+                        if not is_output_buffered():
+                            print_spinning_wheel(chunk_count)
                     else:
                         on_llm_token_response(delta)
                         on_stdout_flush()
                 on_llm_token_response("\n")
                 on_stdout_flush()
+                if last_chunk is not None and last_chunk.get('done'):
+                    report_prompt_evaluation(last_chunk, first_token_time)
             else:
+                report_prompt_evaluation(stream)
                 tool_calls = stream['message'].get('tool_calls', [])
 
                 if len(tool_calls) > 0:
@@ -1842,9 +4281,114 @@ def ask_ollama_with_conversation(conversation, model, temperature=0.1, prompt_te
     else:
         return None
 
-def ask_ollama(system_prompt, user_input, selected_model, temperature=0.1, prompt_template=None, tools=[], no_bot_prompt=False, stream_active=True, num_ctx=None):
+def add_ephemeral_context(conversation, context):
+    """
+    Copy a conversation for a single request, adding dynamic context (e.g. memories relevant to the last user message) right before the last user message.
+
+    The system prompt and the earlier turns are sent byte-identical from one turn to the next, so Ollama reuses the key-value cache of this prefix and only evaluates the end of the conversation. The context is not kept in the conversation.
+
+    :param conversation: The conversation, not modified.
+    :param context: The dynamic context, nothing is added if empty.
+    :return: A copy of the conversation, messages being copied too.
+    """
+    request_conversation = [copy_message(message) for message in conversation]
+    if not context:
+        return request_conversation
+
+    last_user_index = len(request_conversation)
+    for i in range(len(request_conversation) - 1, -1, -1):
+        if get_message_field(request_conversation[i], 'role') == 'user':
+            last_user_index = i
+            break
+
+    if no_system_role and last_user_index < len(request_conversation):
+        # Models without system role support get the context in the user message
+        request_conversation[last_user_index]['content'] = f"{context}\n\n{request_conversation[last_user_index]['content']}"
+    else:
+        request_conversation.insert(last_user_index, {"role": "system", "content": context})
+
+    return request_conversation
+
+def report_prompt_evaluation(response, first_token_time=None):
+    """
+    Show, in verbose mode, the time to first token and the number of prompt tokens evaluated by Ollama, tokens of a cached prompt prefix not being evaluated again.
+    """
+    if not verbose_mode or response is None:
+        return
+
+    prompt_eval_count = response.get('prompt_eval_count')
+    if first_token_time is None:
+        # Without streaming, the first token comes right after the model loading and the prompt evaluation
+        durations = [response.get('load_duration'), response.get('prompt_eval_duration')]
+        if all(duration is None for duration in durations):
+            return
+        first_token_time = sum(duration or 0 for duration in durations) / 1e9
+
+    message = f"Time to first token: {first_token_time:.2f}s"
+    if prompt_eval_count is not None:
+        message += f", {prompt_eval_count} prompt tokens evaluated"
+    on_print(message + ".", Fore.WHITE + Style.DIM)
+
+def generate_responses_concurrently(generations, show_spinner=False):
+    """
+    Run several ask_ollama_with_conversation calls at the same time, each in its own thread with its output buffered.
+    The calls must not use tools: tools may ask for user input or change global state such as the current collection.
+
+    :param generations: The keyword arguments of each call, every call must have its own copy of the conversation.
+    :param show_spinner: Show a spinner until all the generations finish.
+    :return: A list with a tuple (response, output) per call, the output being replayed with replay_output().
+    """
+    stop_event = threading.Event()
+
+    def generate(kwargs):
+        output_buffer.calls = []
+        output_buffer.stop_event = stop_event
+        try:
+            return ask_ollama_with_conversation(**kwargs), output_buffer.calls
+        finally:
+            output_buffer.calls = None
+            output_buffer.stop_event = None
+
+    with ThreadPoolExecutor(max_workers=len(generations)) as executor:
+        futures = [executor.submit(generate, kwargs) for kwargs in generations]
+        spinner_index = 0
+        while True:
+            try:
+                _, pending = wait(futures, timeout=0.1)
+                if not pending:
+                    break
+                if show_spinner:
+                    print_spinning_wheel(spinner_index)
+                    spinner_index += 1
+            except KeyboardInterrupt:
+                # Stop the streams, keeping what was generated so far
+                stop_event.set()
+
+    return [future.result() for future in futures]
+
+def ask_ollama(system_prompt, user_input, selected_model, temperature=0.1, prompt_template=None, tools=[], no_bot_prompt=False, stream_active=True, num_ctx=None, cache_purpose=None):
+    """
+    Answer a user input with a system prompt.
+
+    :param cache_purpose: Set for helper calls whose answer only depends on their inputs, e.g. "chain_of_thought", to reuse the answer from the LLM response cache when enabled.
+    """
+    # Tool calls have side effects, their answers are never reused
+    use_cache = llm_response_cache is not None and cache_purpose and not tools
+    if use_cache:
+        options = {"temperature": temperature, "num_ctx": num_ctx, "prompt_template": prompt_template, "use_openai": use_openai}
+        cached_response = llm_response_cache.get(cache_purpose, selected_model, options, system_prompt, user_input)
+        if cached_response is not None:
+            if verbose_mode:
+                on_print(f"Reusing cached {cache_purpose} response.", Fore.WHITE + Style.DIM)
+            return cached_response
+
     conversation = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_input}]
-    return ask_ollama_with_conversation(conversation, selected_model, temperature, prompt_template, tools, no_bot_prompt, stream_active, num_ctx=num_ctx)
+    response = ask_ollama_with_conversation(conversation, selected_model, temperature, prompt_template, tools, no_bot_prompt, stream_active, num_ctx=num_ctx)
+
+    if use_cache and response:
+        llm_response_cache.put(cache_purpose, selected_model, options, system_prompt, user_input, response)
+
+    return response
 
 def find_latest_user_message(conversation):
     # Iterate through the conversation list in reverse order
@@ -1965,7 +4509,7 @@ If no tool is relevant to answer, simply return an empty array: [].
 """
 
     # Call the existing ask_ollama function
-    tool_response = ask_ollama(system_prompt, user_input, selected_model, temperature, prompt_template, no_bot_prompt=True, stream_active=False, num_ctx=num_ctx)
+    tool_response = ask_ollama(system_prompt, user_input, selected_model, temperature, prompt_template, no_bot_prompt=True, stream_active=False, num_ctx=num_ctx, cache_purpose="tool_routing")
 
     if verbose_mode:
         on_print(f"Tool response: {tool_response}", Fore.WHITE + Style.DIM)
@@ -1985,7 +4529,7 @@ def select_ollama_model_if_available(model_name):
         return None
 
     try:
-        models = ollama.list()["models"]
+        models = get_ollama_clients().list()["models"]
     except:
         on_print("Ollama API is not running.", Fore.RED)
         return None
@@ -2081,7 +4625,7 @@ def prompt_for_ollama_model(default_model, current_model):
 
     # List existing ollama models
     try:
-        models = ollama.list()["models"]
+        models = get_ollama_clients().list()["models"]
     except:
         on_print("Ollama API is not running.", Fore.RED)
         return None
@@ -2186,6 +4730,33 @@ def load_chroma_client():
             on_print("ChromaDB client could not be initialized. Please check the host and port.", Fore.RED + Style.DIM)
         chroma_client = None
 
+def parse_duration(value):
+    """
+    Parse a duration in seconds, with an optional unit: "8", "8s", "500ms" or "1m".
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(ms|s|m)?\s*', value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid duration: {value}")
+
+    duration = float(match.group(1))
+    unit = match.group(2)
+    if unit == 'ms':
+        return duration / 1000
+    if unit == 'm':
+        return duration * 60
+    return duration
+
+def parse_keep_alive(value):
+    """
+    Parse an Ollama keep-alive value: a duration such as "10m" or "1h", or a number of seconds, -1 keeping the model loaded indefinitely.
+    """
+    value = value.strip()
+    if re.fullmatch(r'-?\d+', value):
+        return int(value)
+    if not re.fullmatch(r'(\d+(\.\d+)?(ms|s|m|h))+', value):
+        raise argparse.ArgumentTypeError(f"Invalid keep-alive: {value}")
+    return value
+
 def run():
     global current_collection_name
     global memory_collection_name
@@ -2212,6 +4783,31 @@ def run():
     global other_instance_url
     global listening_port
     global memory_manager
+    global context_budget
+    global context_keep_turns
+    global index_batch_size
+    global incremental_indexing
+    global index_jobs
+    global web_crawl_jobs
+    global web_crawl_jobs_per_host
+    global http_cache
+    global web_cache_max_age_days
+    global web_cache_max_chunks
+    global web_cache_max_size
+    global web_cache_compaction_interval
+    global pdf_max_pages
+    global web_extraction_mode
+    global web_timeout
+    global web_max_download_size
+    global web_search_cache
+    global web_search_retries
+    global pdf_text_cache
+    global index_chunk_size
+    global use_keyword_index
+    global embedding_cache
+    global query_expansion_cache
+    global llm_response_cache
+    global ollama_clients
     
     default_model = None
     prompt_template = None
@@ -2248,10 +4844,48 @@ def run():
     parser.add_argument('--anonymous', type=bool, help='Do not use the user name from the environment variables', default=False, action=argparse.BooleanOptionalAction)
     parser.add_argument('--memory', type=str, help='Use memory manager for context management', default=True, action=argparse.BooleanOptionalAction)
     parser.add_argument('--context-window', type=int, help='Ollama context window size, if not specified, the default value is used, which is 2048 tokens', default=None) 
+    parser.add_argument('--context-budget', type=int, help="Maximum number of tokens of the conversation sent to the model, older turns being folded into a summary when it is exceeded, 0 to send the whole conversation", default=context_budget)
+    parser.add_argument('--context-keep-turns', type=int, help="Number of recent turns always sent verbatim when older turns are folded into a summary", default=context_keep_turns)
     parser.add_argument('--auto-start', type=bool, help="Start the conversation automatically", default=False, action=argparse.BooleanOptionalAction)
     parser.add_argument('--tools', type=str, help="List of tools to activate and use in the conversation, separated by commas", default=None)
     parser.add_argument('--memory-collection-name', type=str, help="Name of the memory collection to use for context management", default=memory_collection_name)
     parser.add_argument('--long-term-memory-file', type=str, help="Long-term memory file name", default=long_term_memory_file)
+    parser.add_argument('--embedding-cache', type=bool, help="Cache embeddings on disk and reuse them for identical texts", default=True, action=argparse.BooleanOptionalAction)
+    parser.add_argument('--embedding-cache-size', type=int, help="Maximum number of embeddings kept in the embedding cache", default=embedding_cache_max_entries)
+    parser.add_argument('--query-expansion-cache', type=bool, help="Cache query expansions on disk and reuse them for identical questions", default=True, action=argparse.BooleanOptionalAction)
+    parser.add_argument('--query-expansion-cache-ttl', type=float, help="Number of hours during which cached query expansions are reused, 0 for no expiration", default=query_expansion_cache_ttl)
+    parser.add_argument('--query-expansion-cache-size', type=int, help="Maximum number of query expansions kept in the cache", default=query_expansion_cache_max_entries)
+    parser.add_argument('--llm-cache', type=bool, help="Cache the answers of helper LLM calls (/cot reasoning plans, tool selection, long-term memory extraction) on disk and reuse them for identical requests", default=False, action=argparse.BooleanOptionalAction)
+    parser.add_argument('--llm-cache-ttl', type=float, help="Number of hours during which cached helper LLM answers are reused, 0 for no expiration", default=llm_response_cache_ttl)
+    parser.add_argument('--llm-cache-size', type=int, help="Maximum number of answers kept in the helper LLM answers cache", default=llm_response_cache_max_entries)
+    parser.add_argument('--keyword-index', type=bool, help="Maintain a full-text index of indexed documents, fused with vector search results at query time", default=use_keyword_index, action=argparse.BooleanOptionalAction)
+    parser.add_argument('--index-chunk-size', type=int, help="Maximum chunk size in characters when indexing documents, small Markdown sections are merged up to this size", default=index_chunk_size)
+    parser.add_argument('--web-crawl-jobs', type=int, help="Maximum number of web pages fetched and extracted concurrently during a web search, 1 to fetch them one after another", default=web_crawl_jobs)
+    parser.add_argument('--web-crawl-jobs-per-host', type=int, help="Maximum number of web pages fetched concurrently from the same host", default=web_crawl_jobs_per_host)
+    parser.add_argument('--http-cache', type=bool, help="Cache web pages on disk, honouring Cache-Control, ETag and Last-Modified headers", default=True, action=argparse.BooleanOptionalAction)
+    parser.add_argument('--http-cache-size', type=int, help="Maximum size of the HTTP cache in MB", default=http_cache_max_size)
+    parser.add_argument('--web-cache-max-age', type=float, help="Maximum age in days of the pages kept in the web cache collection, 0 for no limit", default=web_cache_max_age_days)
+    parser.add_argument('--web-cache-max-chunks', type=int, help="Maximum number of chunks kept in the web cache collection, least recently hit pages are evicted first, 0 for no limit", default=web_cache_max_chunks)
+    parser.add_argument('--web-cache-max-size', type=int, help="Maximum size in MB of the pages kept in the web cache collection, 0 for no limit", default=web_cache_max_size)
+    parser.add_argument('--web-cache-compaction-interval', type=int, help="Minimum number of seconds between two background prunings of the web cache after web searches, -1 to only prune with /cache prune", default=web_cache_compaction_interval)
+    parser.add_argument('--web-timeout', type=parse_duration, help="Time budget of a web search (search, page fetches and indexing), e.g. 8s, 0 for no limit. Pages not indexed in time are skipped", default=web_timeout)
+    parser.add_argument('--web-max-download-size', type=float, help="Maximum size in MB of a web page or document downloaded by web searches, larger HTML pages are truncated and other documents skipped, 0 for no limit", default=web_max_download_size)
+    parser.add_argument('--web-search-cache-ttl', type=float, help="Number of hours during which web search results are cached and reused for the same query, 0 to disable the cache", default=web_search_cache_ttl)
+    parser.add_argument('--web-search-retries', type=int, help="Number of retries, with exponential backoff, when web searches are rate limited", default=web_search_retries)
+    parser.add_argument('--web-extraction', type=str, help="Text extracted from web pages: 'main' to keep the main content only, 'full' to keep the whole page", choices=['main', 'full'], default=web_extraction_mode)
+    parser.add_argument('--pdf-max-pages', type=int, help="Maximum number of pages extracted from PDF documents found by web searches, 0 for no limit", default=pdf_max_pages)
+    parser.add_argument('--pdf-cache', type=bool, help="Cache the text extracted from PDF documents on disk, keyed by document hash", default=True, action=argparse.BooleanOptionalAction)
+    parser.add_argument('--index-jobs', type=int, help="Number of processes reading and chunking files, and of concurrent embedding requests, when indexing documents", default=index_jobs)
+    parser.add_argument('--incremental-index', type=bool, help="Only index new or changed files, and remove the chunks of deleted files, when indexing documents", default=incremental_indexing, action=argparse.BooleanOptionalAction)
+    parser.add_argument('--ollama-chat-host', type=str, help="Ollama host used for chat generations, e.g. http://localhost:11434, the OLLAMA_HOST environment variable is used if not specified", default=None)
+    parser.add_argument('--ollama-embed-host', type=str, help="Ollama host used for embeddings, the chat host is used if not specified", default=None)
+    parser.add_argument('--ollama-chat-timeout', type=parse_duration, help="Timeout of Ollama chat requests, e.g. 300s or 5m, 0 for no timeout", default=0)
+    parser.add_argument('--ollama-embed-timeout', type=parse_duration, help="Timeout of Ollama embeddings requests, e.g. 60s, 0 for no timeout", default=0)
+    parser.add_argument('--ollama-chat-keep-alive', type=parse_keep_alive, help="How long the chat model stays loaded in memory after a request, e.g. 10m, -1 to keep it loaded, the Ollama server default is used if not specified", default=None)
+    parser.add_argument('--ollama-embed-keep-alive', type=parse_keep_alive, help="How long the embeddings model stays loaded in memory after a request, e.g. 30m, -1 to keep it loaded, the Ollama server default is used if not specified", default=None)
+    parser.add_argument('--ollama-chat-connections', type=int, help="Maximum number of connections to the Ollama chat host", default=4)
+    parser.add_argument('--ollama-embed-connections', type=int, help="Maximum number of connections to the Ollama embeddings host, at least the number of indexing jobs", default=10)
+    parser.add_argument('--index-batch-size', type=int, help="Number of chunks to embed and upsert per batch when indexing documents, 0 to embed chunks one by one", default=index_batch_size)
     args = parser.parse_args()
 
     preferred_collection_name = args.collection
@@ -2284,8 +4918,55 @@ def run():
     use_memory_manager = args.memory
     num_ctx = args.context_window
     auto_start_conversation = args.auto_start
+    context_budget = args.context_budget
+    context_keep_turns = args.context_keep_turns
     memory_collection_name = args.memory_collection_name
     long_term_memory_file = args.long_term_memory_file
+    index_batch_size = args.index_batch_size
+    incremental_indexing = args.incremental_index
+    index_jobs = args.index_jobs
+    web_crawl_jobs = args.web_crawl_jobs
+    web_crawl_jobs_per_host = args.web_crawl_jobs_per_host
+    web_cache_max_age_days = args.web_cache_max_age
+    web_cache_max_chunks = args.web_cache_max_chunks
+    web_cache_max_size = args.web_cache_max_size
+    web_cache_compaction_interval = args.web_cache_compaction_interval
+    pdf_max_pages = args.pdf_max_pages
+    web_extraction_mode = args.web_extraction
+    web_timeout = args.web_timeout
+    web_max_download_size = args.web_max_download_size
+    web_search_retries = args.web_search_retries
+    index_chunk_size = args.index_chunk_size
+    use_keyword_index = args.keyword_index
+
+    ollama_clients = OllamaClients(
+        chat_host=args.ollama_chat_host,
+        embed_host=args.ollama_embed_host,
+        chat_timeout=args.ollama_chat_timeout or None,
+        embed_timeout=args.ollama_embed_timeout or None,
+        chat_keep_alive=args.ollama_chat_keep_alive,
+        embed_keep_alive=args.ollama_embed_keep_alive,
+        chat_connections=max(1, args.ollama_chat_connections),
+        embed_connections=max(args.ollama_embed_connections, index_jobs)
+    )
+
+    if args.embedding_cache:
+        embedding_cache = EmbeddingCache(embedding_cache_file, max_entries=args.embedding_cache_size)
+
+    if args.query_expansion_cache:
+        query_expansion_cache = QueryExpansionCache(query_expansion_cache_file, ttl=args.query_expansion_cache_ttl * 3600, max_entries=args.query_expansion_cache_size)
+
+    if args.llm_cache:
+        llm_response_cache = LlmResponseCache(llm_response_cache_file, ttl=args.llm_cache_ttl * 3600, max_entries=args.llm_cache_size)
+
+    if args.http_cache:
+        http_cache = HttpCache(http_cache_file, max_size=args.http_cache_size * 1024 * 1024)
+
+    if args.pdf_cache:
+        pdf_text_cache = PdfTextCache(pdf_text_cache_file)
+
+    if args.web_search_cache_ttl > 0:
+        web_search_cache = WebSearchCache(web_search_cache_file, ttl=args.web_search_cache_ttl * 3600)
 
     if verbose_mode and num_ctx:
         on_print(f"Ollama context window size: {num_ctx}", Fore.WHITE + Style.DIM)
@@ -2343,7 +5024,7 @@ def run():
 
     if args.index_documents:
         load_chroma_client()
-        document_indexer = DocumentIndexer(args.index_documents, current_collection_name, chroma_client, embeddings_model)
+        document_indexer = DocumentIndexer(args.index_documents, current_collection_name, chroma_client, embeddings_model, batch_size=index_batch_size, incremental=incremental_indexing, jobs=index_jobs, chunk_size=index_chunk_size)
         document_indexer.index_documents()
 
     auto_start_conversation = ("starts_conversation" in chatbot and chatbot["starts_conversation"]) or auto_start_conversation
@@ -2424,6 +5105,7 @@ def run():
         conversation = []
 
     current_model = selected_model
+    conversation_window = ConversationWindow(context_budget, context_keep_turns, current_model, num_ctx=num_ctx, verbose=verbose_mode)
 
     answer_and_exit = False
     if not interactive_mode and user_prompt:
@@ -2434,12 +5116,6 @@ def run():
 
         if chroma_client:
             memory_manager = MemoryManager(memory_collection_name, chroma_client, current_model, embeddings_model, verbose_mode, num_ctx=num_ctx, long_term_memory_file=long_term_memory_file)
-
-            if initial_message:
-                # Add long-term memory to the system prompt
-                long_term_memory = memory_manager.long_term_memory_manager.memory
-
-                initial_message["content"] += f"\n\nLong-term memory: {long_term_memory}"
         else:
             use_memory_manager = False
 
@@ -2542,8 +5218,11 @@ def run():
                     on_print(f"Context window must be between 0 and {max_context_length}.", Fore.RED)
                 else:
                     num_ctx = context_window * 1024
+                    conversation_window.num_ctx = num_ctx
                     if verbose_mode:
                         on_print(f"Context window changed to {num_ctx} tokens.", Fore.WHITE + Style.DIM)
+            elif user_input.strip() == "/context":
+                on_print(conversation_window.get_report(conversation, num_ctx), Fore.WHITE + Style.DIM)
             else:
                 on_print(f"Please specify context window size with /context <number>.", Fore.RED)
             continue
@@ -2559,7 +5238,7 @@ def run():
                 on_print("No ChromaDB collection loaded.", Fore.RED)
                 set_current_collection(prompt_for_vector_database_collection())
 
-            document_indexer = DocumentIndexer(user_input.split("/index")[1].strip(), current_collection_name, chroma_client, embeddings_model)
+            document_indexer = DocumentIndexer(user_input.split("/index")[1].strip(), current_collection_name, chroma_client, embeddings_model, batch_size=index_batch_size, incremental=incremental_indexing, jobs=index_jobs, chunk_size=index_chunk_size)
             document_indexer.index_documents()
             continue
 
@@ -2576,7 +5255,7 @@ def run():
             formatted_conversation = "\n".join([f"{entry['role']}: {entry['content']}" for entry in conversation if "content" in entry and entry["content"] and "role" in entry and entry["role"] != "system" and entry["role"] != "tool"])
             formatted_conversation += "\n\n" + user_input
 
-            enhanced_input = ask_ollama(chain_of_thoughts_system_prompt, formatted_conversation, selected_model, temperature, prompt_template, no_bot_prompt=True, stream_active=False, num_ctx=num_ctx)
+            enhanced_input = ask_ollama(chain_of_thoughts_system_prompt, formatted_conversation, selected_model, temperature, prompt_template, no_bot_prompt=True, stream_active=False, num_ctx=num_ctx, cache_purpose="chain_of_thought")
             if enhanced_input:
                 user_input = "Question: " + user_input + "\n\n" + enhanced_input
                 if verbose_mode:
@@ -2618,6 +5297,7 @@ def run():
         if user_input == "/model":
             selected_model = prompt_for_model(default_model, current_model)
             current_model = selected_model
+            conversation_window.selected_model = selected_model
 
             if use_memory_manager:
                 load_chroma_client()
@@ -2681,6 +5361,12 @@ def run():
             delete_collection(memory_collection_name)
             continue
 
+        if user_input == "/cache prune":
+            load_chroma_client()
+            if chroma_client:
+                prune_web_cache(web_cache_collection_name)
+            continue
+
         if "/rmcollection" in user_input or "/deletecollection" in user_input:
             if "/rmcollection" in user_input and len(user_input.split("/rmcollection")) > 1:
                 collection_name = user_input.split("/rmcollection")[1].strip()
@@ -2772,15 +5458,35 @@ def run():
         elif len(user_input.strip()) > 0:
             conversation.append({"role": "user", "content": user_input})
 
+        conversation_window.apply(conversation)
+
+        # Memories change with every query, they are sent after the stable part of the conversation so Ollama can reuse its cached prefix
+        ephemeral_context = []
         if memory_manager:
-            memory_manager.handle_user_query(conversation)
+            ephemeral_context.append(f"Long-term memory: {memory_manager.long_term_memory_manager.memory}")
+            ephemeral_context.append(memory_manager.handle_user_query(conversation))
+        request_conversation = add_ephemeral_context(conversation, "\n\n".join(context for context in ephemeral_context if context))
+        request_length = len(request_conversation)
 
         # Generate response
-        bot_response = ask_ollama_with_conversation(conversation, selected_model, temperature=temperature, prompt_template=prompt_template, tools=selected_tools, stream_active=stream_active, num_ctx=num_ctx)
-
         alternate_bot_response = None
+        bot_conversation = request_conversation
         if alternate_model:
-            alternate_bot_response = ask_ollama_with_conversation(conversation, alternate_model, temperature=temperature, prompt_template=prompt_template, tools=selected_tools, prompt="\nAlt", prompt_color=Fore.CYAN, stream_active=stream_active, num_ctx=num_ctx)
+            # Each model answers on its own copy of the conversation
+            alternate_conversation = [copy_message(message) for message in request_conversation]
+            bot_generation = dict(conversation=bot_conversation, model=selected_model, temperature=temperature, prompt_template=prompt_template, tools=selected_tools, stream_active=stream_active, num_ctx=num_ctx)
+            alternate_generation = dict(conversation=alternate_conversation, model=alternate_model, temperature=temperature, prompt_template=prompt_template, tools=selected_tools, prompt="\nAlt", prompt_color=Fore.CYAN, stream_active=stream_active, num_ctx=num_ctx)
+            if not selected_tools:
+                # Both models answer at the same time, their outputs are shown one after the other
+                (bot_response, bot_output), (alternate_bot_response, alternate_output) = generate_responses_concurrently([bot_generation, alternate_generation], show_spinner=syntax_highlighting and interactive_mode)
+                replay_output(bot_output)
+                replay_output(alternate_output)
+            else:
+                # Tools may prompt the user or switch the current collection, they only run in the main thread
+                bot_response = ask_ollama_with_conversation(**bot_generation)
+                alternate_bot_response = ask_ollama_with_conversation(**alternate_generation)
+        else:
+            bot_response = ask_ollama_with_conversation(bot_conversation, selected_model, temperature=temperature, prompt_template=prompt_template, tools=selected_tools, stream_active=stream_active, num_ctx=num_ctx)
         
         bot_response_handled_by_plugin = False
         for plugin in plugins:
@@ -2807,6 +5513,10 @@ def run():
             choice = on_user_input("Enter the number of your preferred response [1]: ") or "1"
             bot_response = bot_response if choice == "1" else alternate_bot_response
 
+        # Keep the tool calls and tool results of the selected response, without the ephemeral context
+        selected_conversation = bot_conversation if not alternate_bot_response or choice == "1" else alternate_conversation
+        conversation.extend(selected_conversation[request_length:])
+
         # Add bot response to conversation history
         conversation.append({"role": "assistant", "content": bot_response})
 
@@ -2827,6 +5537,17 @@ def run():
         if answer_and_exit:
             break
 
+    if verbose_mode and embedding_cache:
+        on_print(embedding_cache.get_stats(), Fore.WHITE + Style.DIM)
+    if verbose_mode and query_expansion_cache:
+        on_print(query_expansion_cache.get_stats(), Fore.WHITE + Style.DIM)
+    if verbose_mode and llm_response_cache:
+        on_print(llm_response_cache.get_stats(), Fore.WHITE + Style.DIM)
+    if verbose_mode and http_cache:
+        on_print(http_cache.get_stats(), Fore.WHITE + Style.DIM)
+    if verbose_mode and web_search_cache:
+        on_print(web_search_cache.get_stats(), Fore.WHITE + Style.DIM)
+
     # Stop plugins, calling on_exit if available
     for plugin in plugins:
         if hasattr(plugin, "on_exit") and callable(getattr(plugin, "on_exit")):
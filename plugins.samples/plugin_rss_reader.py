@@ -5,6 +5,11 @@ from xml.etree.ElementTree import XML
 class RssFeedLoaderPlugin:
     def __init__(self, rss_file='rss_feed.txt'):
         self.rss_file = rss_file
+        self.http_session = None
+
+    def set_http_session(self, http_session):
+        # Shared HTTP session of the main program, reusing connections and cached feeds
+        self.http_session = http_session
 
     def on_user_input_done(self, user_input, verbose_mode=False):
         return None
@@ -50,7 +55,7 @@ class RssFeedLoaderPlugin:
 
     def load_feed(self, url):
         try:
-            response = requests.get(url)
+            response = (self.http_session or requests).get(url)
             response.raise_for_status()  # Raise an error for bad status codes
             return response.text
         except Exception as e:
@@ -4,6 +4,7 @@ import sys
 class PluginSample:
     def __init__(self):
         self.web_crawler = None
+        self.http_session = None
 
     def set_web_crawler(self, web_crawler_class):
         """
@@ -13,6 +14,14 @@ class PluginSample:
         """
         self.web_crawler = web_crawler_class
 
+    def set_http_session(self, http_session):
+        """
+        Set the HTTP session shared with the main program, pooling connections and caching responses on disk.
+
+        :param http_session: A requests.Session, use it instead of requests.get to fetch URLs.
+        """
+        self.http_session = http_session
+
     def on_user_input(self, input_prompt):
         """
         Handle user input before it is processed by the main program.
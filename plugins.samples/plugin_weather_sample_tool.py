@@ -2,6 +2,13 @@ import requests
 import json
 
 class WeatherPluginSample():
+    def __init__(self):
+        self.http_session = None
+
+    def set_http_session(self, http_session):
+        # Shared HTTP session of the main program, reusing connections and cached responses
+        self.http_session = http_session
+
     def get_tool_definition(self):
         return {
             'type': 'function',
@@ -29,7 +36,7 @@ class WeatherPluginSample():
         url = f"https://wttr.in/{city}?format=j2"
         
         # Make the API request
-        response = requests.get(url)
+        response = (self.http_session or requests).get(url)
         
         # Check if the response status code is OK
         if response.status_code == 200:
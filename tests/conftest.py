@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+@pytest.fixture(autouse=True)
+def user_data_dir(tmp_path, monkeypatch):
+    """
+    Keep the SQLite caches created by the tests away from the user data directory.
+    """
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path))
+    return tmp_path
@@ -0,0 +1,56 @@
+import pytest
+
+import ollama_chat
+
+chat_completion = pytest.importorskip("openai.types.chat")
+
+def get_tool_call_message():
+    return chat_completion.ChatCompletionMessage(role="assistant", content=None, tool_calls=[
+        chat_completion.ChatCompletionMessageToolCall(id="call_1", type="function", function={"name": "web_search", "arguments": '{"query": "weather in Paris"}'})
+    ])
+
+def get_conversation(turns):
+    conversation = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(turns):
+        conversation.append({"role": "user", "content": f"Question {i} " + "word " * 50})
+        conversation.append(get_tool_call_message())
+        conversation.append({"role": "tool", "content": "Sunny " * 20, "tool_call_id": "call_1"})
+        conversation.append({"role": "assistant", "content": f"Answer {i} " + "word " * 50})
+    return conversation
+
+def test_tool_call_message_objects_are_counted():
+    window = ollama_chat.ConversationWindow()
+    message = get_tool_call_message()
+    assert window.count_message_tokens(message) > window.message_overhead
+
+    pinned, summary_message, turns = window.split(get_conversation(2))
+    assert len(pinned) == 1
+    assert summary_message is None
+    assert [len(turn) for turn in turns] == [4, 4]
+    assert "Recent turns (2)" in window.get_report(get_conversation(2))
+
+def test_turns_with_message_objects_are_folded(monkeypatch):
+    requests = []
+    def fake_ask_ollama(system_prompt, user_input, *args, **kwargs):
+        requests.append(user_input)
+        return "The user asked about the weather."
+    monkeypatch.setattr(ollama_chat, "ask_ollama", fake_ask_ollama)
+
+    window = ollama_chat.ConversationWindow(budget=200, keep_turns=1)
+    conversation = get_conversation(3)
+    last_turn = conversation[-4:]
+    window.apply(conversation)
+
+    assert len(requests) == 1
+    assert "Question 0" in requests[0] and "Sunny" not in requests[0]
+    assert conversation[1] is window.summary_message
+    assert conversation[2:] == last_turn
+
+def test_ephemeral_context_keeps_message_objects():
+    conversation = get_conversation(1)
+    conversation.append({"role": "user", "content": "And tomorrow?"})
+    request_conversation = ollama_chat.add_ephemeral_context(conversation, "Memories")
+
+    assert request_conversation[-2] == {"role": "system", "content": "Memories"}
+    assert request_conversation[2] is conversation[2]
+    assert len(conversation) == 6
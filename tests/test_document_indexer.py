@@ -0,0 +1,84 @@
+import hashlib
+import threading
+
+import chromadb
+import pytest
+
+import ollama_chat
+
+def fake_get_embeddings(texts, model):
+    return [[byte / 255 for byte in hashlib.sha256(text.encode('utf-8')).digest()[:8]] for text in texts]
+
+@pytest.fixture
+def chroma_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(ollama_chat, "get_embeddings", fake_get_embeddings)
+    monkeypatch.setattr(ollama_chat, "on_print", lambda *args, **kwargs: None)
+    return chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+
+def write_text(path, paragraphs):
+    path.write_text("\n\n".join(f"Paragraph {i}. " + "Some words about indexing. " * 10 for i in range(paragraphs)), encoding='utf-8')
+
+def index_folder(folder, chroma_client, jobs=1):
+    indexer = ollama_chat.DocumentIndexer(str(folder), "documents", chroma_client, "stub-embeddings", batch_size=4, incremental=True, jobs=jobs, chunk_size=200)
+    indexer.index_documents(no_chunking_confirmation=True)
+    return indexer
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_large_files_are_streamed(tmp_path, chroma_client, monkeypatch, jobs):
+    monkeypatch.setattr(ollama_chat, "streaming_file_size", 10)
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    write_text(folder / "large.txt", 20)
+
+    indexer = index_folder(folder, chroma_client, jobs)
+    chunk_ids = indexer.collection.get()["ids"]
+    document_id = ollama_chat.get_file_document_id(str(folder / "large.txt"))
+    assert len(chunk_ids) > 20
+    assert sorted(chunk_ids) == sorted(f"{document_id}_{i}" for i in range(len(chunk_ids)))
+
+    entries = ollama_chat.IndexManifest("documents", ollama_chat.get_chroma_database_id(chroma_client)).get_entries(str(folder))
+    assert sorted(entries[str(folder / "large.txt")]["chunk_ids"]) == sorted(chunk_ids)
+
+    # A shorter version of the file replaces the chunks of the previous one
+    write_text(folder / "large.txt", 5)
+    indexer = index_folder(folder, chroma_client, jobs)
+    new_chunk_ids = indexer.collection.get()["ids"]
+    assert 5 <= len(new_chunk_ids) < len(chunk_ids)
+    assert sorted(new_chunk_ids) == sorted(f"{document_id}_{i}" for i in range(len(new_chunk_ids)))
+
+def test_manifest_is_kept_per_database(tmp_path, chroma_client):
+    # The same collection name in two databases, both holding documents
+    other_client = chromadb.PersistentClient(path=str(tmp_path / "other_chroma"))
+    other_folder = tmp_path / "other_docs"
+    other_folder.mkdir()
+    write_text(other_folder / "other.txt", 3)
+    other_chunk_count = index_folder(other_folder, other_client).collection.count()
+
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    write_text(folder / "notes.txt", 3)
+    chunk_count = index_folder(folder, chroma_client).collection.count()
+
+    # The files indexed in the first database are not skipped as unchanged in the other one
+    assert index_folder(folder, other_client).collection.count() == chunk_count + other_chunk_count
+
+def test_stale_chunks_are_deleted_by_the_writer(tmp_path, chroma_client, monkeypatch):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    write_text(folder / "notes.txt", 10)
+    index_folder(folder, chroma_client, jobs=2)
+
+    delete_threads = []
+    collection_class = type(chroma_client.get_collection("documents"))
+    delete = collection_class.delete
+    def record_delete(self, *args, **kwargs):
+        delete_threads.append(threading.current_thread())
+        return delete(self, *args, **kwargs)
+    monkeypatch.setattr(collection_class, "delete", record_delete)
+
+    write_text(folder / "notes.txt", 2)
+    indexer = index_folder(folder, chroma_client, jobs=2)
+    assert delete_threads and threading.main_thread() not in delete_threads
+
+    entries = ollama_chat.IndexManifest("documents", ollama_chat.get_chroma_database_id(chroma_client)).get_entries(str(folder))
+    assert sorted(entries[str(folder / "notes.txt")]["chunk_ids"]) == sorted(indexer.collection.get()["ids"])
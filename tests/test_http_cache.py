@@ -0,0 +1,81 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import ollama_chat
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Responses of the stub origin, by path: (Cache-Control header, body)
+    pages = {
+        "/revalidated": ("no-cache", b"revalidated page"),
+        "/fresh": ("max-age=3600", b"fresh page"),
+    }
+
+    def do_GET(self):
+        cache_control, body = self.pages[self.path]
+        etag = '"v1"'
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", cache_control)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def origin():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def get_url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+def test_revalidation_is_served_from_cache(origin):
+    cache = ollama_chat.HttpCache()
+    session = ollama_chat.CachedSession(cache=cache, timeout=5)
+    url = get_url(origin, "/revalidated")
+
+    response = session.get(url)
+    assert response.status_code == 200
+    assert response.content == b"revalidated page"
+    assert not response.from_cache
+    assert origin.requests == [("/revalidated", None)]
+
+    response = session.get(url)
+    assert response.status_code == 200
+    assert response.content == b"revalidated page"
+    assert response.from_cache
+    assert origin.requests == [("/revalidated", None), ("/revalidated", '"v1"')]
+
+    assert (cache.misses, cache.revalidations, cache.hits) == (1, 1, 0)
+
+def test_fresh_response_skips_origin(origin):
+    cache = ollama_chat.HttpCache()
+    session = ollama_chat.CachedSession(cache=cache, timeout=5)
+    url = get_url(origin, "/fresh")
+
+    assert session.get(url).content == b"fresh page"
+    response = session.get(url)
+    assert response.content == b"fresh page"
+    assert response.from_cache
+    assert origin.requests == [("/fresh", None)]
+
+    assert (cache.misses, cache.revalidations, cache.hits) == (1, 0, 1)
@@ -0,0 +1,23 @@
+import ollama_chat
+
+def test_identifiers_are_single_tokens():
+    assert ollama_chat.preprocess_text("Error ERR-1234-5 on RFC/2616 at 10:30, a well-known issue.") == ["error", "err_1234_5", "rfc_2616", "10_30", "well", "known", "issue"]
+
+def test_identifiers_are_matched_as_a_whole():
+    keyword_index = ollama_chat.KeywordIndex("documents", "test-database")
+    documents = {
+        "exact": "Error code ERR-1234-5 is reported when the pump fails.",
+        "other_code": "Error code ERR-1234-6 is reported when the valve fails.",
+        "number": "The pump 5 uses 1234 watts.",
+    }
+    keyword_index.upsert(list(documents), [" ".join(ollama_chat.preprocess_text(document)) for document in documents.values()])
+
+    assert keyword_index.search(ollama_chat.preprocess_text("What does ERR-1234-5 mean?")) == ["exact"]
+
+def test_keyword_indexes_are_kept_per_database():
+    first = ollama_chat.KeywordIndex("documents", "first-database")
+    second = ollama_chat.KeywordIndex("documents", "second-database")
+    first.upsert(["chunk"], ["pump"])
+
+    assert first.search(["pump"]) == ["chunk"]
+    assert second.search(["pump"]) == []
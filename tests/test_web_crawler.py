@@ -0,0 +1,21 @@
+import pytest
+
+import ollama_chat
+
+@pytest.mark.parametrize("content_type, first_bytes, kind", [
+    ("text/html; charset=utf-8", b"<html>", "html"),
+    ("application/pdf", b"%PDF-1.7", "pdf"),
+    ("text/plain", b"notes", "text"),
+    ("text/markdown", b"# Title", "text"),
+    ("text/x-rst", b"Title\n=====", "text"),
+    ("application/json", b'{"key": 1}', "text"),
+    ("application/ld+json", b'{"@context": ""}', "text"),
+    ("image/png", b"\x89PNG\r\n", None),
+    ("application/zip", b"PK\x03\x04", None),
+    ("application/octet-stream", b"%PDF-1.4", "pdf"),
+    ("application/octet-stream", b"PK\x03\x04\x14\x00\x00\x00", None),
+    (None, b"<!DOCTYPE html><html>", "html"),
+])
+def test_sniff_content_kind(content_type, first_bytes, kind):
+    crawler = ollama_chat.SimpleWebCrawler([])
+    assert crawler.sniff_content_kind(content_type, first_bytes) == kind
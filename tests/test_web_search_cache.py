@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+import ollama_chat
+
+class StubSearchClient:
+    def __init__(self):
+        self.queries = []
+
+    def text(self, query, max_results=5):
+        self.queries.append(query)
+        return [{"href": f"https://example.com/{len(self.queries)}", "title": query}]
+
+@pytest.fixture
+def search_client(monkeypatch):
+    client = StubSearchClient()
+    monkeypatch.setattr(ollama_chat, "web_search_client", client)
+    monkeypatch.setattr(ollama_chat, "web_search_cache", ollama_chat.WebSearchCache(ttl=3600))
+    return client
+
+def test_same_query_is_a_hit(search_client):
+    results = ollama_chat.search_web("Python  Java")
+    assert ollama_chat.search_web("python java") == results
+    assert search_client.queries == ["Python  Java"]
+    assert ollama_chat.web_search_cache.hits == 1
+
+def test_different_queries_are_misses(search_client):
+    ollama_chat.search_web("python java")
+    ollama_chat.search_web("python not java")
+    ollama_chat.search_web("java python")
+    ollama_chat.search_web("python java", n_results=10)
+    assert search_client.queries == ["python java", "python not java", "java python", "python java"]
+    assert ollama_chat.web_search_cache.hits == 0
+
+def test_expired_results_are_searched_again(search_client, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    ollama_chat.search_web("python java")
+
+    monkeypatch.setattr(time, "time", lambda: now + 3599)
+    ollama_chat.search_web("python java")
+    assert len(search_client.queries) == 1
+
+    monkeypatch.setattr(time, "time", lambda: now + 3601)
+    ollama_chat.search_web("python java")
+    assert len(search_client.queries) == 2